@@ -5,179 +5,120 @@
 ## For comments and suggestions Mike.Peleah@gmail.com
 ##
 #################################################################################################################
-import requests
-import json
-import re
-import time, datetime, os
-from random import randint
-from time import sleep
+import datetime, os
+import sys
 
-def mkdir(dir_name, verbose = False):
-    # Safe create directory.
-    try:
-        # Create target Directory
-        os.mkdir(dir_name)
-        if verbose:
-            print("Directory " , dir_name,  " created ")
-        return 0
-    except FileExistsError:
-        if verbose:
-            print("Directory " , dir_name,  " already exists")
-        return 1
-    return
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from devdata.blobs import BlobStore, set_blob_store
+from devdata.cache import HttpCache
+from devdata.client import HttpClient, set_client
+from devdata.crawl import Crawler, HostLimiter
+from devdata.journal import Journal, set_journal
+from devdata.ratelimit import AdaptiveRateLimiter, set_rate_limiter
+from devdata.store import SnapshotStore, get_store, set_store
+from devdata.telemetry import ProgressLine, get_telemetry
+from devdata.undp import mkdir, load_operating_units, get_unit_projects
+from devdata.undp_bulk import PROJECTS_MEMBER, get_project_zip, ingest_projects, iter_project_list, iter_project_zip
 
+# **** MAIN SCRIPT ****************************************************************
 
-def try_get(url, ntries=3, delay=10, verbose = False):
-    """
-    Try to get url for ntries, after each unsuccessful attempt delay for delay seconds
-    return {'code': result code, "Ok" if Ok, "Error" else
-            'result': result of get}
-    """
-    attempts = ntries
+# Journal of completed operating units, projects and documents in snapshot folder. Restarted run
+# skips everything recorded there, delete the file to get everything again
+journal_file = "crawl-progress.log"
 
-    while attempts>0:
-        attempts_try = attempts
-        if verbose:
-            print("%d attemps left, trying %s" % (attempts, url))
-        try:
-            result = requests.get(url)
-            code = "Ok"
-            attempts = 0
-            result.raise_for_status()
-        except requests.exceptions.HTTPError as errh:
-            attempts = 0
-            code = "Error"
-            result = "Http Error: %s" % errh
-            if verbose:
-                  print (result)
-        except requests.exceptions.ConnectionError as errc:
-            attempts = attempts_try - 1
-            code = "Error"
-            result = "Error Connecting: %s" % errc
-            if verbose:
-                  print (result)
-            sleep(delay)
-        except requests.exceptions.Timeout as errt:
-            attempts = attempts_try - 1
-            code = "Error"
-            result = "Timeout Error: %s" % errt
-            if verbose:
-                  print (result)
-            sleep(delay)
-        except requests.exceptions.RequestException as err:
-            attempts = 0
-            code = "Error"
-            if verbose:
-                  print (result)
-            result = "Oops: Something Else %s" % err
-        #if verbose:
-            #print("  ",code, result if code=="Error" else "")
-    return {'code': code, 'result': result}
+# How to get projects: "projects" -- one request per project of every operating unit,
+# "project_list" -- 1000-row pages of Project Data API, "zip" -- bulk undp-project-data.zip.
+# Bulk rows are saved as 'bulk' records, project records keep the /api/projects/{id}.json schema.
+# Bulk modes make per-project requests only for projects lacking fields in bulk_detail_fields.
+# Bulk rows have no outputs and documents, so with [] none are got here and Access UNDP Project
+# Results.py requests projects it needs; ["document_name", "outputs"] gets them for all projects
+ingest_mode = "projects"
+bulk_detail_fields = []
+# Member of undp-project-data.zip with one row per project, rows of other members are not projects
+zip_projects_member = PROJECTS_MEMBER
 
+# Number of parallel workers for getting projects and documents. Set to 0 to get them one by one
+crawl_workers = 32
+# Maximum number of simultaneous requests to a host, crawl_host_caps overrides it for listed hosts
+crawl_host_default = 4
+crawl_host_caps = {"api.open.undp.org": 16}
+# Starting requests per second per host, adjusted while crawling: raised while responses are
+# healthy, cut on 429, 5xx and growing latency
+crawl_host_rates = {"api.open.undp.org": 20}
 
-def get_project_data_file(p, verbose = False):
-    """
-    Get project data and associated files
-    Input:
-      p--project data structuire from operation unit json
-      verbose--True for all printouts
-    Return:
-      0 Ok
-      Error code if cannot get 
-    """
-    # Get project data and dump to file
-	# Individual Project Data: https://api.open.undp.org/api/projects/{project - id}.json
-    r = requests.get(f"https://api.open.undp.org/api/projects/{p['id']}.json")
-    if r.status_code != 200:
-        return r.status_code
-    p_data = r.json()
-    with open(f"{p['id']}.json", 'w', encoding='utf-8') as f:
-        json.dump(p_data, f, ensure_ascii=False, indent=4)
-    # Getting project documents
-    if "document_name" in p_data.keys():
-        # "document_name" is organized as three lists [0] titles, [1] urls, and [2] formats
-        # check if any documnts included, i.e. documents[0] is not empty
-        documents = p_data["document_name"]
-        if documents[0]:
-            # create folder for documents
-            mkdir(f"{p['id']}")
-            os.chdir(f"{p['id']}")
-            # Loop over titles
-            for i, title in enumerate(documents[0]):
-			    # Skip  Activity Web Page
-                if title == "Activity Web Page":
-                    print("    Skipping Activity Web Page")
-                else:
-                    url = documents[1][i]
-                    print(f"    Getting document '{title}' from {url}")
-                    try_doc = try_get(url, ntries=3, delay=10, verbose = False)
-                    if try_doc['code'] == "Ok":
-					    # Replace unsafe characters from title by the underscore
-                        safe_dir = re.sub("[\t\"\'\\*/\\\\!\\|:?<>]", "_", re.sub("(%22)", "_", title))
-                        mkdir(safe_dir)
-                        os.chdir(safe_dir)
-						# Replace unsafe characters from filename by the underscore
-                        fname = re.sub("[\t\"\'\\*/\\\\!\\|:?<>]", "_", re.sub("(%22)", "_", re.split('/', url)[-1]))
-                        print(f"      Ok, saving {safe_dir}/{fname}")
-                        with open(fname, 'wb') as f:
-                            f.write(try_doc['result'].content)
-                        os.chdir('..')
-                    else:
-                        print(f"      Unsuccesful, {try_doc['result']}")
-            os.chdir('..')
-    return 0
+# Folder for HTTP cache shared by daily snapshots, unchanged units, projects and documents
+# are revalidated and copied from cache instead of downloaded again. Set to None for no cache
+http_cache_dir = "UNDP HTTP Cache"
+http_cache_size = 20 * 2**30
 
-# **** MAIN SCRIPT ****************************************************************
+# Folder of document store shared by all snapshots: each document is kept once by its hash, and
+# a document URL fetched before, in any project or snapshot, is only revalidated. Project folders get
+# hardlinks to stored documents ("copy" to copy them, "manifest" for MANIFEST.tsv lines instead of files).
+# Set to None to download documents to project folders
+document_store = "UNDP Documents"
+document_link = "hardlink"
+
+# SQLite file to pack units and projects of all snapshots into, instead of one json file per record.
+# Set to None to keep json files in snapshot folder
+packed_store = None
+# packed_store = "UNDP Snapshots.sqlite"
+
+# Request and write telemetry is saved to {telemetry_name}.json and .prom in snapshot folder
+telemetry_name = "telemetry"
+
+# All requests go through one pooled client, which also applies per-host caps
+http_cache = HttpCache(http_cache_dir, max_bytes=http_cache_size) if http_cache_dir else None
+set_client(HttpClient(pool_size=max(crawl_workers, 1), limiter=HostLimiter(crawl_host_default, crawl_host_caps),
+                      cache=http_cache, rate_limiter=set_rate_limiter(AdaptiveRateLimiter(rates=crawl_host_rates))))
+crawler = Crawler(workers=crawl_workers, verbose=True) if crawl_workers > 0 else None
 
 today = datetime.date.today()  
 todaystr = today.isoformat()
+if packed_store:
+    set_store(SnapshotStore(packed_store, todaystr))
+blobs = set_blob_store(BlobStore(document_store, link=document_link)) if document_store else None
 # Use the folder
 mkdir(f"UNDP Projects {todaystr}")
 os.chdir(f"UNDP Projects {todaystr}")
+journal = set_journal(Journal(journal_file))
 
 # Get index of operational units -- from file if it exists, othervise from web 
-if os.path.isfile('operating-unit-index.json'):
-    with open('operating-unit-index.json', 'r', encoding='utf-8') as f:
-        oui = json.load(f)
-else:
-    r = requests.get("https://api.open.undp.org/api/units/operating-unit-index.json")
-    oui = r.json()
-    with open("operating-unit-index.json", 'w', encoding='utf-8') as f:
-        json.dump(oui, f, ensure_ascii=False, indent=4)
+oui = load_operating_units()
 
-# This dictionary is used for quick skip to country/project. Set "skip_ou" and "skip_project" to avoid skipping. 
-skip_to = {"op_unit": "PAL", "project_id": "00057409",
-           "skip_ou": True, "skip_project": True}
-    
-# Loop over all operational units
-for ou in oui:
-    # Check if we reached op_unit to skip, then drop skip flag. 
-    if ou['id'] == skip_to["op_unit"]:
-        skip_to["skip_ou"] = False
-    if skip_to["skip_ou"]:
-        print(f"Skipping {ou['id']} - {ou['name']}")
-        continue
-    print(f"Handling {ou['id']} - {ou['name']}")
-    mkdir(f"{ou['id']}")
-    os.chdir(f"{ou['id']}")
-    # Get list of project for an operating unit and dump them to file
-	# Operating Unit Data: https://api.open.undp.org/api/units/{operating - unit}.json
-    r = requests.get(f"https://api.open.undp.org/api/units/{ou['id']}.json")
-    ou_prj = r.json()
-    with open(f"{ou['id']}.json", 'w', encoding='utf-8') as f:
-        json.dump(ou_prj, f, ensure_ascii=False, indent=4)
-    # Loop through projects 
-    for p in ou_prj['projects']:
-        # Check if we reached project_id to skip, then drop skip flag. 
-        if p['id'] == skip_to["project_id"]:
-            skip_to["skip_project"] = False
-        if skip_to["skip_project"]:
-            print(f"  Skipping {p['id']} - {p['title']}")
-            continue
-        # Now handle the project
-        print(f"\n  Project {ou['id']}:{p['id']} - {p['title']}")
-        get_project_data_file(p, verbose = True)
-    # time.sleep(randint(1,5))
-    os.chdir('..')
+if ingest_mode == "projects":
+    # Loop over all operational units
+    progress = ProgressLine(len(oui), "units")
+    for ou in oui:
+        print(f"Handling {ou['id']} - {ou['name']}")
+        get_unit_projects(ou, crawler=crawler, verbose = True, progress=progress)
+else:
+    if ingest_mode == "project_list":
+        records = iter_project_list(verbose=True)
+    else:
+        zip_name = get_project_zip()
+        records = (row for member, row in iter_project_zip(zip_name, members=[zip_projects_member])) if zip_name else []
+    n_bulk, n_detail = ingest_projects(records, oui, bulk_detail_fields, crawler=crawler, verbose=True)
+    print(f"Saved {n_bulk} projects from bulk data, {n_detail} projects requested one by one")
+if crawler is not None:
+    errors = crawler.join()
+    print(f"Crawl finished, {len(errors)} tasks failed")
+if ingest_mode == "projects":
+    progress.close()
+if http_cache is not None:
+    print(f"{http_cache.hits} responses unchanged since last run, served from cache")
+if blobs is not None:
+    n_blobs, n_bytes, n_urls = blobs.stats()
+    print(f"Documents: {blobs.downloaded} downloaded, {blobs.revalidated} unchanged, {blobs.reused} reused; "
+          f"store holds {n_blobs} documents of {n_urls} URLs, {n_bytes / 2**20:.1f} MB")
+    blobs.close()
+print(f"{journal.count('ou')} operating units, {journal.count('project')} projects and "
+      f"{journal.count('document')} documents completed")
+telemetry = get_telemetry()
+telemetry.save(telemetry_name)
+summary = telemetry.summary()
+print(f"{summary['requests']} requests, {summary['requests_per_s']:.1f} per second, "
+      f"{summary['bytes_in'] / 2**20:.1f} MB, {summary['retries']} retries")
+journal.close()
+get_store().close()
 os.chdir('..')
 print("* * *  That's all, Folks!  * * *")
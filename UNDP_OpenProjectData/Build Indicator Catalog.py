@@ -0,0 +1,38 @@
+#################################################################################################################
+##
+## Script for building catalog of UNDP project results indicators with near-duplicate wordings merged
+## GitHub https://github.com/MikePeleah/development-data-apis
+## For comments and suggestions Mike.Peleah@gmail.com
+##
+#################################################################################################################
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from devdata.indicator_catalog import build_catalog, iter_indicator_records, write_catalog
+
+# **** MAIN SCRIPT ****************************************************************
+
+# Folder with project files and indicators written by Access UNDP Project Results.py:
+# indicators.ndjson, or indicators folder of Parquet parts
+projects_folder = "UNDP Projects 2020-12-03"
+indicators_file = "indicators.ndjson"
+# indicators_file = "indicators"
+
+# Wordings with estimated similarity (Jaccard of 5-character shingles) at least threshold are merged
+threshold = 0.6
+
+# Catalog is written to {catalog_name}.ndjson, one record per indicator, and {catalog_name}-occurrences.ndjson,
+# one record per (operating_unit_id, project, output) and wording; "parquet" for Parquet folders
+catalog_name = "indicator-catalog"
+catalog_format = "ndjson"
+
+os.chdir(projects_folder)
+start = time.time()
+catalog = build_catalog(iter_indicator_records(indicators_file), threshold=threshold, verbose=True)
+write_catalog(catalog, catalog_name, catalog_format)
+print(f"{len(catalog)} indicators written in {time.time() - start:.1f} s")
+for c in catalog[:10]:
+    print(f"  {c['count']:6d}  {c['indicator']}")
+os.chdir('..')
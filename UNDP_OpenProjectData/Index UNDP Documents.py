@@ -0,0 +1,60 @@
+#################################################################################################################
+##
+## Script for full-text indexing and search of UNDP project documents downloaded from open.undp.org
+## GitHub https://github.com/MikePeleah/development-data-apis
+## For comments and suggestions Mike.Peleah@gmail.com
+##
+#################################################################################################################
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from devdata.docindex import DocumentIndex
+from devdata.store import FileStore, SnapshotStore
+
+# **** MAIN SCRIPT ****************************************************************
+
+# Snapshot folder with documents under {ou}/{project}/{title}/, as saved by Access UNDP Project Data and Files.py
+projects_folder = "UNDP Projects 2020-12-03"
+# Document store of that script, to read documents kept as MANIFEST.tsv lines. None if documents are files
+document_store = "UNDP Documents"
+# SQLite file to pack units and projects and date of snapshot, for document titles. None to read json files
+packed_store = None
+# packed_store = "UNDP Snapshots.sqlite"
+snapshot = "2020-12-03"
+
+# Index file, shared by all snapshots: documents indexed before are not extracted again
+index_file = "UNDP Documents.index.sqlite"
+# Number of processes extracting text, None for number of CPUs
+index_workers = None
+
+# Queries to run after update: keywords and "quoted phrases", all must match
+queries = ['"gender equality"', 'renewable energy Kazakhstan']
+
+
+def main():
+    # Text is extracted in worker processes, which import this script again under spawn
+    # and forkserver start methods, so nothing may run at import time
+    store = SnapshotStore(packed_store, snapshot) if packed_store else FileStore(projects_folder)
+    index = DocumentIndex(index_file)
+    start = time.time()
+    n_changed, n_extracted, n_removed = index.update(projects_folder, blob_dir=document_store, store=store,
+                                                     workers=index_workers, verbose=True)
+    n_files, n_contents, n_text = index.stats()
+    print(f"{n_changed} new or changed files, {n_extracted} documents extracted, {n_removed} removed "
+          f"in {time.time() - start:.1f} s; index holds {n_files} files, {n_contents} distinct documents, "
+          f"{n_text} with text")
+
+    for q in queries:
+        start = time.perf_counter()
+        hits = index.search(q)
+        print(f"\n{q}: {len(hits)} documents in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for h in hits:
+            print(f"  {h['ou']}:{h['project']} - {h['title']} ({h['path']})")
+    index.close()
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
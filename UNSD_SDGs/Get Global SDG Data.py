@@ -8,65 +8,17 @@
 #################################################################################################################
 
 import json
-import requests
 import os
 import re
 import csv
-from random import randint
-from time import sleep
+import itertools
+import sys
 
-def progress_bar(done, total, l=10):
-    pdone = done / total
-    a = int(pdone * l)
-    b = l - a 
-    return "%d done out of %d, %4.1f%% done [%s%s]" % (done, total, pdone*100, u'\u2588'*a, u'\u2591'*b)
-
-def try_get(url, ntries=3, delay=10, verbose = False):
-    """
-    Try to get url for ntries, after each unsuccessful attempt delay for delay seconds
-    return {'code': result code, "Ok" if Ok, "Error" else
-            'result': result of get}
-    """
-    attempts = ntries
-
-    while attempts>0:
-        attempts_try = attempts
-        if verbose:
-            print("%d attemps left, trying %s" % (attempts, url))
-        try:
-            result = requests.get(url)
-            code = "Ok"
-            attempts = 0
-            result.raise_for_status()
-        except requests.exceptions.HTTPError as errh:
-            attempts = 0
-            code = "Error"
-            result = "Http Error: %s" % errh
-            if verbose:
-                  print (result)
-        except requests.exceptions.ConnectionError as errc:
-            attempts = attempts_try - 1
-            code = "Error"
-            result = "Error Connecting: %s" % errc
-            if verbose:
-                  print (result)
-            sleep(delay)
-        except requests.exceptions.Timeout as errt:
-            attempts = attempts_try - 1
-            code = "Error"
-            result = "Timeout Error: %s" % errt
-            if verbose:
-                  print (result)
-            sleep(delay)
-        except requests.exceptions.RequestException as err:
-            attempts = 0
-            code = "Error"
-            if verbose:
-                  print (result)
-            result = "Oops: Something Else %s" % err
-        if verbose:
-            print("  ",code, result if code=="Error" else "")
-    return {'code': code, 'result': result}
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from devdata.client import try_get
+from devdata.telemetry import ProgressLine, get_telemetry
+from devdata.sdg import DimensionCache, get_dimension_cache, load_series_bulk, load_series_parallel, set_dimension_cache
+from devdata.sdg_refresh import SdgRefresher
 
 def get_UNSTAT_meta(series, verbose):
     """
@@ -80,8 +32,7 @@ def get_UNSTAT_meta(series, verbose):
     list includes all possible disaggregations
     """
     UNSTAT_meta = []
-    n_series = len(series)
-    for i, that_series in enumerate(series):
+    for that_series in (ProgressLine(len(series), "series").iter(series) if verbose else series):
         d = that_series['description']
         s = that_series['code']
         indicator = that_series['indicator'][0]    # 'indicator' is a list 
@@ -89,9 +40,8 @@ def get_UNSTAT_meta(series, verbose):
             print("Handling ", s)
         # check if series has some diaggregations
         if s in dim_aggrs.keys():
-            # then get dimesions 
-            dims_req = requests.get("https://unstats.un.org/SDGAPI/v1/sdg/Series/"+s+"/Dimensions")
-            dims = json.loads(dims_req.content)
+            # then get dimesions, from cache if they didn't change since series release
+            dims = get_dimension_cache().get(s, that_series.get('release', ''))
             # print(dims)
             # generate full list of dims
             full_dims_c = []
@@ -120,11 +70,28 @@ def get_UNSTAT_meta(series, verbose):
                                 'name': d,
                                 'source': 'UNSTAT Global SDG Indicators Database',
                                 'metadata': 'https://unstats.un.org/wiki/display/SDGeHandbook/Indicator+' + indicator})
-        if verbose:
-            print(progress_bar(i+1, n_series, l=15))
     return UNSTAT_meta
 
 
+def write_metadata(series):
+    """
+    Write series names with disaggregations to UNSTAT_series_list.json and Series.Metadata.CSV
+    """
+    UNSTAT_meta = get_UNSTAT_meta(series, verbose=False)
+    with open("UNSTAT_series_list.json", 'w', encoding='utf-8') as f:
+        json.dump(UNSTAT_meta, f, ensure_ascii=False, indent=4)
+    full_list =[]
+    full_list.extend(UNSTAT_meta)
+    with open("Series.Metadata.CSV", "w", encoding="utf-8") as f:
+        f.write(f'"code","name","source","metadata"\n')
+        for s in full_list:
+            code = s['code']
+            name = s['name']
+            source = s['source']
+            metadata = s['metadata']
+            f.write(f'"{code}","{name}","{source}","{metadata}"\n')
+
+
 def load_series_list(force_download = False, save_json = True, json_name = "SDG_Series_List.json", verbose = False):
     """
     Get list of series from https://unstats.un.org/SDGAPI/v1/sdg/Series/List?allreleases=false
@@ -144,64 +111,30 @@ def load_series_list(force_download = False, save_json = True, json_name = "SDG_
         series_req = try_get("https://unstats.un.org/SDGAPI/v1/sdg/Series/List?allreleases=false", verbose = verbose)
         if series_req['code']=="Ok":
             series = json.loads(series_req['result'].content.decode('UTF-8'))
+        elif os.path.isfile(json_name):
+            # Server not available, fall back to list saved before
+            print("Cannot get series list, loading it from file %s" % json_name)
+            with open(json_name, "r") as f:
+                series = json.load(f)
+            return series
         else:
             series = []
-    if save_json and (not os.path.isfile(json_name) or force_download):
+    if save_json and series and (not os.path.isfile(json_name) or force_download):
         if verbose:
             print("Writing series json to file %s" % json_name)
         with open(json_name, 'w', encoding='utf-8') as f:
             json.dump(series, f, ensure_ascii=False, indent=4)
     return series
 
-def get_dims(series_code, dim_ignore=[]):
+def get_dims(series_code, dim_ignore=[], release=""):
     # Get list of dimensions for a series and ignore those in list   
-    dim_url = "https://unstats.un.org/SDGAPI/v1/sdg/Series/"+series_code+"/Dimensions"
-    dim_req = requests.get(dim_url)
-    dim = json.loads(dim_req.content)
+    dim = get_dimension_cache().get(series_code, release)
     dim_list = [i['id'] for i in dim if i['id'] not in dim_ignore]
     return dim_list
 
-def load_series_data(series_code, countries=[1], save_tsv=True, code_inc_dims=[]):
-    """
-    Loads series for list of countries. Include in series code dimensions listed in code_inc_dims. Dump results into csv file if save_csv
-    """
-    if os.path.isfile(".\\Data\\" + series_code + ".tsv"):
-        return 1
-    f_tsv = open(".\\Data\\" + series_code + ".tsv", "w")
-    f_big = open(".\\Data\\UNSTAT-ALL-DATA.tsv", "a")
-    for c in countries:
-        url = "https://unstats.un.org/SDGAPI/v1/sdg/Series/" + series_code + "/GeoArea/" + str(c) + "/DataSlice"
-        try_rec = try_get(url)
-        if try_rec['code'] == "Ok":
-            req = try_rec['result']
-        else:
-            print("Something went wrong getting %s for %s: %s" % (series_code, M49_ISO.get(c), try_rec['result']))
-            req = try_rec['result'] 
-        if req.status_code == 200:
-            data = json.loads(req.content)
-            c_ISO = M49_ISO.get(c)
-            for d in data['dimensions']:
-                # print(d)
-                series_unique=series_code
-                for cid in code_inc_dims:
-                    if cid in d.keys():
-                        series_unique = series_unique + "_" + d[cid].strip()
-                    else:
-                        print("! Warning, %s doesn't has dimension %s" %(series_code, cid))
-                write_str = "{}\t{}\t{}\t{}\t{}\n".format(c_ISO,
-                                                          series_unique,
-                                                          d['timePeriodStart'],
-                                                          d['value'], [(k, d[k]) for k in d.keys() if k not in data_fields])
-                f_tsv.write(write_str)
-                f_big.write(write_str)
-        else:
-            print('Something went wrong...')
-    f_tsv.close()
-    f_big.close()
-    return 0
-
-
 dim_ignore = ['Reporting Type']
+# Dimension codes left out of series names with disaggregations, e.g. '_T' for totals
+codes_ignore = []
 data_fields = ['value', 'timePeriodStart', 'Reporting Type']
 
 # KAZ + OECD Countries + Central Asia
@@ -210,6 +143,27 @@ countries=[398,  36,  40,  56, 124, 152, 203, 208, 233, 246, 250, 276, 300,
            578, 616, 620, 703, 705, 724, 752, 756, 792, 826, 840, 417, 762,
            795, 860]
 
+# How to load data: "bulk" -- multi-series, multi-country /Series/Data queries read page by page,
+# "slice" -- one /Series/{code}/GeoArea/{m49}/DataSlice request per series per country,
+# slice_workers series are loaded at once
+fetch_mode = "bulk"
+slice_workers = 8
+
+# Keep running and refresh data as new releases come out, see devdata/sdg_refresh.py: Series/List is polled
+# every refresh_interval seconds (refresh_release_interval in release months) and only countries whose
+# rows changed are rewritten. False to load once and exit
+refresh_daemon = False
+refresh_interval = 24*3600
+refresh_release_interval = 3600
+
+# Folder for per-series .tsv files and UNSTAT-ALL-DATA.tsv
+data_dir = "Data"
+
+# Folder of typed Parquet store partitioned by goal and series, see devdata/sdg_parquet.py,
+# requires pyarrow. None to write .tsv files only
+parquet_dir = None
+# parquet_dir = os.path.join(data_dir, "parquet")
+
 # Goals to load. If list is empty -- load all goals, else list goals to load
 goals_to_load = ["1", "17"]
 # goals_to_load = []
@@ -367,9 +321,19 @@ if os.path.isfile("M49-ISO.txt"):
 else:
     M49_ISO = {1: "World"}
 
-series = load_series_list()
+# Series/List is requested on every run: releases of its series are the keys of dimensions cache below
+series = load_series_list(force_download=True)
 
-n_series = len(series)
+# Dimensions of series are cached on disk by series release, drop cache of releases no longer in Series/List
+dims_cache = set_dimension_cache(DimensionCache("SDG Dimensions Cache"))
+if series:
+    dims_cache.purge({s.get('release', '') for s in series})
+
+series_to_load = []
+columnar = None
+if parquet_dir is not None:
+    from devdata.sdg_parquet import SdgParquetWriter
+    columnar = SdgParquetWriter(parquet_dir, {s['code']: s['goal'][0] for s in series if s.get('goal')}, data_fields)
 # Load series 
 for i, s in enumerate(series):
     # Check if we need to load this series, if it is in goal list
@@ -381,23 +345,35 @@ for i, s in enumerate(series):
             if g in goals_to_load:
                 load_this_series = True
     if load_this_series:
-        cid = dim_aggrs.get(s['code']) if s['code'] in dim_aggrs.keys() else []
-        print("Loading {}, dims {}".format(s['code'], cid))
-        print(load_series_data(series_code = s['code'], countries=countries, save_tsv=True, code_inc_dims=cid))
-        print(progress_bar(i+1, n_series, 33))
+        series_to_load.append(s['code'])
+os.makedirs(data_dir, exist_ok=True)
+if refresh_daemon:
+    # Refresher loads series without .tsv and re-reads series of new releases only, its first poll
+    # is run by refresher.run() below, after metadata is written or failed
+    refresher = SdgRefresher(countries, M49_ISO, data_fields, dim_aggrs, goals=goals_to_load, data_dir=data_dir,
+                             columnar=columnar, interval=refresh_interval,
+                             release_interval=refresh_release_interval)
+elif series_to_load and fetch_mode == "bulk":
+    n_queries, n_rows = load_series_bulk(series_to_load, countries, M49_ISO, data_fields, dim_aggrs,
+                                         data_dir=data_dir, columnar=columnar)
+    print("Loaded {} rows of {} series with {} queries".format(n_rows, len(series_to_load), n_queries))
+elif series_to_load:
+    n_loaded, n_rows = load_series_parallel(series_to_load, countries, M49_ISO, data_fields, dim_aggrs,
+                                            data_dir=data_dir, workers=slice_workers, columnar=columnar)
+    print("Loaded {} rows of {} series, {} series were loaded before or failed".format(
+        n_rows, n_loaded, len(series_to_load) - n_loaded))
+
+# Generate series names with disaggregations. Refresh service starts even if this fails
+if refresh_daemon:
+    try:
+        write_metadata(series)
+    except Exception as err:
+        print("Something went wrong generating metadata: %r" % err)
+else:
+    write_metadata(series)
 
-# Generate series names with disaggregations
-UNSTAT_meta = get_UNSTAT_meta(series, verbose)
-with open("UNSTAT_series_list.json", 'w', encoding='utf-8') as f:
-    json.dump(UNSTAT_meta, f, ensure_ascii=False, indent=4)
-full_list =[]
-full_list.extend(UNSTAT_meta)
-with open("Series.Metadata.CSV", "w", encoding="utf-8") as f:
-    f.write(f'"code","name","source","metadata"\n')
-    for s in full_list:
-        code = s['code']
-        name = s['name']
-        source = s['source']
-        metadata = s['metadata']
-        f.write(f'"{code}","{name}","{source}","{metadata}"\n')
+# Request and write telemetry: SDG-telemetry.json summary and SDG-telemetry.prom Prometheus text
+get_telemetry().save("SDG-telemetry")
 
+if refresh_daemon:
+    refresher.run()
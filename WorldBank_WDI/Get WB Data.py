@@ -0,0 +1,53 @@
+#################################################################################################################
+##
+## Script for getting data from the WorldBank using API, Python version of Get WB Data.R
+## API Documentation https://datahelpdesk.worldbank.org/knowledgebase/articles/898581-api-basic-call-structures
+## GitHub https://github.com/MikePeleah/development-data-apis
+## For comments and suggestions Mike.Peleah@gmail.com
+##
+#################################################################################################################
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from devdata.client import HttpClient, set_client
+from devdata.crawl import HostLimiter
+from devdata.ratelimit import AdaptiveRateLimiter
+from devdata.wdi import get_wdi_zip, load_wdi, load_wdi_zip, read_column
+
+# **** MAIN SCRIPT ****************************************************************
+
+# Lists of countries and series
+cntry_file = "wb-cntry.csv"
+series_file = "wb-series.csv"
+# Time frame for data, None for all years
+years = "1998:2019"
+# Folder for {series.id}.csv files
+data_dir = "Data-WB"
+
+# Where to get data: "api" -- requests to Indicators API, "bulk" -- WDI bulk CSV archive wdi_zip,
+# downloaded if it doesn't exist. Bulk is one sequential read for any number of series
+wdi_source = "api"
+wdi_zip = "WDI_CSV.zip"
+
+# Number of indicators per request and number of requests at once
+indicators_per_request = 10
+wb_workers = 8
+# Starting requests per second, adjusted to what the API tolerates
+wb_rate = 10
+
+set_client(HttpClient(pool_size=wb_workers, limiter=HostLimiter(wb_workers),
+                      rate_limiter=AdaptiveRateLimiter(rates={"api.worldbank.org": wb_rate})))
+
+countries = read_column(cntry_file, "country.code")
+indicators = read_column(series_file, "series.id")
+print(f"Loading {len(indicators)} series for {len(countries)} countries")
+if wdi_source == "bulk":
+    if not os.path.isfile(wdi_zip) and get_wdi_zip(wdi_zip) is None:
+        print(f"No WDI archive {wdi_zip}, download it or set wdi_source = \"api\"")
+        sys.exit(1)
+    n_series, n_rows = load_wdi_zip(wdi_zip, indicators, countries, date=years, data_dir=data_dir)
+else:
+    n_series, n_rows = load_wdi(indicators, countries, date=years, data_dir=data_dir,
+                                batch=indicators_per_request, workers=wb_workers)
+print(f"Got {n_rows} rows of {n_series} of {len(indicators)} series")
@@ -0,0 +1,4 @@
+"""
+Shared helpers for the development data API scripts in this repository.
+GitHub https://github.com/MikePeleah/development-data-apis
+"""
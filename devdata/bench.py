@@ -0,0 +1,204 @@
+"""
+Offline crawl benchmarks: every pipeline runs against MockServer stand-ins, see devdata.mockapi,
+in a fresh process, and reports requests/s, bytes/s, wall time and peak RSS.
+
+    python -m devdata.bench
+    python -m devdata.bench --pipelines sdg-slice wdi --latency 0.05 --throttle-rate 0.02 --json bench.json
+
+Pipelines:
+  undp-projects--operating units and projects, get_unit_projects() on a Crawler
+  undp-results--projects and results of their outputs, as Access UNDP Project Results.py
+  sdg-slice--Series/List, then load_series_parallel() with DataSlice requests
+  sdg-bulk--Series/List, then load_series_bulk() with Series/Data queries
+  wdi--load_wdi() over wb-series.csv and wb-cntry.csv
+Responses come from fixtures folders {fixtures}/undp, sdg and wdi if given, synthetic otherwise.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from devdata.mockapi import (SDG_HOST, UNDP_HOST, WB_HOST, FixtureStore, MockServer, sdg_responder,
+                             undp_responder, wdi_responder)
+
+PIPELINES = ('undp-projects', 'undp-results', 'sdg-slice', 'sdg-bulk', 'wdi')
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process, ru_maxrss is in KB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+def m49_countries(n):
+    # First n (M49, ISO3) pairs of M49-ISO.txt
+    pairs = []
+    with open(os.path.join(REPO, "UNSD_SDGs", "M49-ISO.txt"), "r") as f:
+        for line in f:
+            codes = line.split('\t')
+            if len(codes) > 1 and codes[0].strip().isdigit():
+                pairs.append((int(codes[0]), codes[1].strip()))
+    return pairs[:n]
+
+
+def run_undp_projects(workers):
+    from devdata.crawl import Crawler
+    from devdata.undp import get_unit_projects, load_operating_units
+    crawler = Crawler(workers=workers)
+    units = load_operating_units()
+    for ou in units:
+        get_unit_projects(ou, crawler=crawler)
+    return len(crawler.join())
+
+
+def run_undp_results(workers):
+    from devdata.client import get_client
+    from devdata.crawl import Crawler
+    from devdata.undp import API, load_operating_units, load_record, load_unit_projects
+
+    def project_results(ou_id, project_id):
+        p_data = load_record('project', ou_id, project_id, f"{API}/projects/{project_id}.json")
+        for output in (p_data or {}).get('outputs', []):
+            r = get_client().get(f"{API}/v1/output/{output['output_id']}/results")
+            if r.status_code == 200:
+                r.json()
+    crawler = Crawler(workers=workers)
+    for ou in load_operating_units():
+        for project in load_unit_projects(ou['id'])['projects']:
+            crawler.submit(project_results, ou['id'], project['id'])
+    return len(crawler.join())
+
+
+def sdg_setup(n_countries):
+    from devdata.client import get_client
+    from devdata.sdg import SDG_API
+    series = get_client().get(f"{SDG_API}/Series/List", params={'allreleases': 'false'}).json()
+    countries = m49_countries(n_countries)
+    os.makedirs("Data", exist_ok=True)
+    return [s['code'] for s in series], [c for c, _ in countries], dict(countries)
+
+
+def run_sdg_slice(workers, n_countries=41):
+    from devdata.sdg import load_series_parallel
+    codes, countries, m49_iso = sdg_setup(n_countries)
+    load_series_parallel(codes, countries, m49_iso, ['value', 'timePeriodStart', 'Reporting Type'], {},
+                         workers=workers)
+    return 0
+
+
+def run_sdg_bulk(workers, n_countries=41):
+    from devdata.sdg import load_series_bulk
+    codes, countries, m49_iso = sdg_setup(n_countries)
+    load_series_bulk(codes, countries, m49_iso, ['value', 'timePeriodStart', 'Reporting Type'], {})
+    return 0
+
+
+def run_wdi(workers):
+    from devdata.wdi import load_wdi, read_column
+    countries = read_column(os.path.join(REPO, "WorldBank_WDI", "wb-cntry.csv"), "country.code")
+    indicators = read_column(os.path.join(REPO, "WorldBank_WDI", "wb-series.csv"), "series.id")
+    load_wdi(indicators, countries, date="1998:2019", workers=workers, per_page=500)
+    return 0
+
+
+RUNNERS = {'undp-projects': run_undp_projects, 'undp-results': run_undp_results,
+           'sdg-slice': run_sdg_slice, 'sdg-bulk': run_sdg_bulk, 'wdi': run_wdi}
+
+
+def child(pipeline, targets, workers, backoff, rate, result):
+    """
+    Run pipeline in this process with the shared client redirected to mock servers,
+    in a temporary folder; put (wall time, peak RSS in MB, number of task errors) to result
+    rate--starting rate of AdaptiveRateLimiter, None for no rate limit
+    """
+    import io
+    import contextlib
+    from devdata.client import HttpClient, set_client
+    from devdata.crawl import HostLimiter
+    from devdata.mockapi import redirect
+    from devdata.ratelimit import AdaptiveRateLimiter
+    client = set_client(HttpClient(pool_size=workers, limiter=HostLimiter(workers), backoff=backoff,
+                                   rate_limiter=AdaptiveRateLimiter(rate=rate) if rate else None))
+    redirect(client, targets)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            errors = RUNNERS[pipeline](workers)
+        wall = time.perf_counter() - start
+        os.chdir(REPO)
+    result.put((wall, peak_rss_mb(), errors))
+
+
+def run(pipelines=PIPELINES, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=1,
+        workers=16, backoff=0.1, fixtures=None, seed=0, rate=None):
+    """
+    Run pipelines against mock servers, return list of result dictionaries
+    """
+    store = (lambda name: FixtureStore(os.path.join(fixtures, name))) if fixtures else (lambda name: None)
+    faults = dict(latency=latency, jitter=jitter, error_rate=error_rate, throttle_rate=throttle_rate,
+                  retry_after=retry_after, seed=seed)
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    with MockServer(undp_responder(store("undp")), **faults) as undp, \
+            MockServer(sdg_responder(store("sdg")), **faults) as sdg, \
+            MockServer(wdi_responder(store("wdi")), **faults) as wdi:
+        servers = (undp, sdg, wdi)
+        targets = {UNDP_HOST: undp.url, SDG_HOST: sdg.url, WB_HOST: wdi.url,
+                   "http://api.worldbank.org": wdi.url}
+        for pipeline in pipelines:
+            before = [(s.requests, s.bytes, dict(s.statuses)) for s in servers]
+            queue = ctx.Queue()
+            proc = ctx.Process(target=child, args=(pipeline, targets, workers, backoff, rate, queue))
+            proc.start()
+            wall, rss, errors = queue.get()
+            proc.join()
+            n_req = sum(s.requests - b[0] for s, b in zip(servers, before))
+            n_bytes = sum(s.bytes - b[1] for s, b in zip(servers, before))
+            statuses = {}
+            for s, b in zip(servers, before):
+                for code, n in s.statuses.items():
+                    if n - b[2].get(code, 0):
+                        statuses[code] = statuses.get(code, 0) + n - b[2].get(code, 0)
+            results.append({'pipeline': pipeline, 'wall_s': wall, 'requests': n_req, 'bytes': n_bytes,
+                            'requests_per_s': n_req / wall if wall else 0.0,
+                            'bytes_per_s': n_bytes / wall if wall else 0.0,
+                            'peak_rss_mb': rss, 'statuses': statuses, 'task_errors': errors})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark crawl pipelines against local mock servers")
+    parser.add_argument("--pipelines", nargs="+", choices=PIPELINES, default=list(PIPELINES))
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, up to seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503 responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of 429 responses")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After of 429 responses, seconds")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--backoff", type=float, default=0.1, help="client backoff base, seconds")
+    parser.add_argument("--fixtures", help="folder with undp, sdg and wdi fixture folders")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rate", type=float, help="starting requests/s of adaptive rate limiter, none if not given")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args(argv)
+    results = run(args.pipelines, args.latency, args.jitter, args.error_rate, args.throttle_rate, args.retry_after,
+                  args.workers, args.backoff, args.fixtures, args.seed, args.rate)
+    print("%-14s %9s %9s %11s %9s %12s %9s" % ("pipeline", "wall s", "requests", "req/s", "MB", "MB/s", "RSS MB"))
+    for r in results:
+        print("%-14s %9.2f %9d %11.1f %9.2f %12.2f %9.1f" % (r['pipeline'], r['wall_s'], r['requests'],
+                                                            r['requests_per_s'], r['bytes'] / 2**20,
+                                                            r['bytes_per_s'] / 2**20, r['peak_rss_mb']))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+    return results
+
+
+if __name__ == "__main__":
+    main()
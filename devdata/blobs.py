@@ -0,0 +1,207 @@
+"""
+Content-addressed store of downloaded documents, shared by all projects and snapshots.
+Each document is kept once as {directory}/objects/{sha256[:2]}/{sha256}, and an SQLite
+index maps document URL to hash, ETag and Last-Modified. A URL fetched before, in any
+project or snapshot, is revalidated with a conditional request (or not requested at all
+within one run) and placed into the project folder as a hardlink, copy or manifest line.
+
+    set_blob_store(BlobStore("UNDP Documents"))
+    res = get_blob_store().fetch(url, "PAL/00057409/Project Document/prodoc.pdf")
+"""
+import contextlib
+import datetime
+import os
+import shutil
+import sqlite3
+import threading
+
+from devdata.cache import cache_key
+from devdata.download import download_file
+from devdata.telemetry import get_telemetry
+
+# Ways to place a blob at its path in project folder
+LINK_MODES = ('hardlink', 'copy', 'manifest')
+MANIFEST = "MANIFEST.tsv"
+
+
+class BlobStore:
+    """
+    Blobs keyed by sha256 plus URL index.
+      directory--folder of the store, created if it doesn't exist
+      link--"hardlink" (copy where hardlinks are not supported), "copy", or "manifest" to
+            write no file but a line {file name, sha256, url} to MANIFEST.tsv of the folder
+      revalidate--False to trust URLs in index without any request
+    URLs revalidated once are not requested again by the same BlobStore, so a template
+    shared by many projects costs one request per run.
+    """
+    def __init__(self, directory, link="hardlink", revalidate=True):
+        if link not in LINK_MODES:
+            raise ValueError("link should be one of %s" % ", ".join(LINK_MODES))
+        self.directory = os.path.abspath(directory)
+        self.link = link
+        self.revalidate = revalidate
+        os.makedirs(os.path.join(self.directory, "objects"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._checked = set()
+        self._url_locks = {}
+        self.db = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, hash TEXT NOT NULL, "
+                        "etag TEXT, last_modified TEXT, size INTEGER, fetched TEXT)")
+        self.db.commit()
+        self.downloaded = 0
+        self.revalidated = 0
+        self.reused = 0
+
+    def path(self, digest):
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def lookup(self, url):
+        """
+        Return (sha256, etag, last modified) of url, None if url is not in index or its blob is missing
+        """
+        with self._lock:
+            row = self.db.execute("SELECT hash, etag, last_modified FROM urls WHERE url=?", (url,)).fetchone()
+        if row is None or not os.path.isfile(self.path(row[0])):
+            return None
+        return row
+
+    def _index(self, url, digest, headers):
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?, ?, ?)",
+                            (url, digest, headers.get('ETag'), headers.get('Last-Modified'),
+                             os.path.getsize(self.path(digest)),
+                             datetime.datetime.now().isoformat(timespec='seconds')))
+            self.db.commit()
+
+    @contextlib.contextmanager
+    def _url_lock(self, url):
+        # One download of url at a time, others wait for it and reuse its blob.
+        # Lock is counted by its users and dropped with the last one, so locks don't pile up
+        with self._lock:
+            entry = self._url_locks.setdefault(url, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._url_locks[url]
+
+    def add_file(self, path, digest):
+        # Move downloaded file with known digest into store, drop it if blob already exists
+        blob = self.path(digest)
+        if os.path.isfile(blob):
+            os.remove(path)
+            return blob
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        os.replace(path, blob)
+        return blob
+
+    def place(self, digest, dest, url=""):
+        """
+        Put blob at dest according to link mode
+        """
+        if self.link == 'manifest':
+            # Line of a file placed before is replaced, not repeated
+            name = os.path.basename(dest)
+            manifest = os.path.join(os.path.dirname(dest), MANIFEST)
+            with self._lock:
+                lines = []
+                if os.path.isfile(manifest):
+                    with open(manifest, "r", encoding="utf-8") as f:
+                        lines = [line for line in f if line.split('\t', 1)[0] != name]
+                lines.append("%s\t%s\t%s\n" % (name, digest, url))
+                with open(manifest + ".tmp", "w", encoding="utf-8") as f:
+                    f.writelines(lines)
+                os.replace(manifest + ".tmp", manifest)
+            return
+        if os.path.isfile(dest):
+            os.remove(dest)
+        if self.link == 'hardlink':
+            try:
+                os.link(self.path(digest), dest)
+                return
+            except OSError:
+                # Other file system, or hardlinks not supported
+                pass
+        shutil.copyfile(self.path(digest), dest)
+
+    def fetch(self, url, dest, client=None, verbose=False):
+        """
+        Get document url to dest through the store
+        Return {'code': "Ok" or "Error", 'result': dest or error message, 'sha256': digest,
+                'reused': True if document was not downloaded}
+        """
+        with self._url_lock(url):
+            known = self.lookup(url)
+            if known is not None and (not self.revalidate or url in self._checked):
+                self.reused += 1
+                self.place(known[0], dest, url)
+                return {'code': "Ok", 'result': dest, 'sha256': known[0], 'reused': True}
+            validators = {}
+            if known is not None:
+                if known[1]:
+                    validators['If-None-Match'] = known[1]
+                if known[2]:
+                    validators['If-Modified-Since'] = known[2]
+            if known is not None and not validators:
+                # Nothing to revalidate with, trust the index
+                self._checked.add(url)
+                self.reused += 1
+                self.place(known[0], dest, url)
+                return {'code': "Ok", 'result': dest, 'sha256': known[0], 'reused': True}
+            # Part file of an interrupted download is resumed, so the name must not change between runs
+            tmp = os.path.join(self.directory, "download-" + cache_key(url))
+            res = download_file(url, tmp, client=client, validators=validators or None, use_cache=False,
+                                verbose=verbose)
+            if res['code'] != "Ok":
+                return {'code': "Error", 'result': res['result']}
+            self._checked.add(url)
+            if res.get('not_modified'):
+                self.revalidated += 1
+                get_telemetry().write('blob revalidated')
+                self.place(known[0], dest, url)
+                return {'code': "Ok", 'result': dest, 'sha256': known[0], 'reused': True}
+            digest = res['sha256']
+            self.add_file(tmp, digest)
+            self._index(url, digest, res.get('headers', {}))
+            self.downloaded += 1
+            get_telemetry().write('blob', 1, os.path.getsize(self.path(digest)))
+            self.place(digest, dest, url)
+            return {'code': "Ok", 'result': dest, 'sha256': digest, 'reused': False}
+
+    def stats(self):
+        # (number of blobs, bytes of blobs, number of urls)
+        n_blobs = n_bytes = 0
+        for folder, _, files in os.walk(os.path.join(self.directory, "objects")):
+            for f in files:
+                n_blobs += 1
+                n_bytes += os.path.getsize(os.path.join(folder, f))
+        with self._lock:
+            n_urls = self.db.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+        return n_blobs, n_bytes, n_urls
+
+    def close(self):
+        with self._lock:
+            self.db.commit()
+            self.db.close()
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    # Shared blob store, None if documents are saved to project folders directly
+    with _blob_store_lock:
+        return _blob_store
+
+
+def set_blob_store(store):
+    global _blob_store
+    with _blob_store_lock:
+        _blob_store = store
+    return store
@@ -0,0 +1,202 @@
+"""
+Persistent on-disk HTTP cache keyed by URL. Responses with ETag or Last-Modified
+are stored and revalidated with If-None-Match/If-Modified-Since, so unchanged
+resources come back as 304 Not Modified and are served from disk.
+Least recently used entries are evicted when the cache grows over max_bytes.
+
+    client = HttpClient(cache=HttpCache("UNDP HTTP Cache", max_bytes=20 * 2**30))
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Response headers kept with cached body
+KEEP_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+def cache_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+class HttpCache:
+    """
+    On-disk response cache.
+      directory--folder for cache files, created if it doesn't exist
+      max_bytes--maximum total size of cached bodies, None for no limit
+    Each entry is two files: {key}.body with response body and {key}.json with
+    url and headers. Modification time of body file is time of last use.
+    """
+    def __init__(self, directory, max_bytes=None):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # key -> [size, last use], loaded from directory
+        self._index = {}
+        for fname in os.listdir(directory):
+            if fname.endswith('.body'):
+                st = os.stat(os.path.join(directory, fname))
+                self._index[fname[:-5]] = [st.st_size, st.st_mtime]
+        self.total_bytes = sum(size for size, _ in self._index.values())
+        self.hits = 0
+        self.stored = 0
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    def lookup(self, url):
+        """
+        Return meta dictionary {'url', 'headers'} of cached response or None
+        """
+        key = cache_key(url)
+        with self._lock:
+            if key not in self._index:
+                return None
+        try:
+            with open(self._path(key, '.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def validators(self, url):
+        """
+        Return conditional request headers for url, empty if it is not cached
+        """
+        meta = self.lookup(url)
+        if meta is None:
+            return {}
+        headers = {}
+        if meta['headers'].get('ETag'):
+            headers['If-None-Match'] = meta['headers']['ETag']
+        if meta['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = meta['headers']['Last-Modified']
+        return headers
+
+    def response(self, url):
+        """
+        Build response from cache, status 200 with attribute from_cache=True
+        Return None if url is not cached
+        """
+        meta = self.lookup(url)
+        if meta is None:
+            return None
+        key = cache_key(url)
+        try:
+            with open(self._path(key, '.body'), 'rb') as f:
+                body = f.read()
+            os.utime(self._path(key, '.body'))
+        except OSError:
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index[key][1] = os.path.getmtime(self._path(key, '.body'))
+            self.hits += 1
+        r = requests.Response()
+        r.status_code = 200
+        r.reason = "OK"
+        r.url = url
+        r.headers = CaseInsensitiveDict(meta['headers'])
+        r._content = body
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        r.from_cache = True
+        return r
+
+    def store(self, url, response):
+        """
+        Store successful response if it can be revalidated, i.e. has ETag or Last-Modified
+        Return True if stored
+        """
+        headers = {h: response.headers[h] for h in KEEP_HEADERS if h in response.headers}
+        if response.status_code != 200 or not ('ETag' in headers or 'Last-Modified' in headers):
+            return False
+        key = cache_key(url)
+        self._write(key, '.body', response.content)
+        self._add(key, url, headers)
+        return True
+
+    def store_file(self, url, headers, path):
+        """
+        Store downloaded file as body of url, e.g. for streamed downloads
+        headers--response headers, stored only if there is ETag or Last-Modified
+        Return True if stored
+        """
+        headers = {h: headers[h] for h in KEEP_HEADERS if h in headers}
+        if not ('ETag' in headers or 'Last-Modified' in headers):
+            return False
+        key = cache_key(url)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, self._path(key, '.body'))
+        self._add(key, url, headers)
+        return True
+
+    def copy_to(self, url, dest):
+        """
+        Copy cached body of url to dest, through temporary file in dest folder
+        Return True if copied, False if url is not cached
+        """
+        if self.lookup(url) is None:
+            return False
+        key = cache_key(url)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dest)), suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(self._path(key, '.body'), tmp)
+            os.utime(self._path(key, '.body'))
+        except OSError:
+            os.remove(tmp)
+            return False
+        os.replace(tmp, dest)
+        with self._lock:
+            if key in self._index:
+                self._index[key][1] = os.path.getmtime(self._path(key, '.body'))
+            self.hits += 1
+        return True
+
+    def _add(self, key, url, headers):
+        # Write meta of just written body and account for its size
+        self._write(key, '.json', json.dumps({'url': url, 'headers': headers}).encode('utf-8'))
+        size = os.path.getsize(self._path(key, '.body'))
+        with self._lock:
+            old = self._index.get(key)
+            if old is not None:
+                self.total_bytes -= old[0]
+            self._index[key] = [size, os.path.getmtime(self._path(key, '.body'))]
+            self.total_bytes += size
+            self.stored += 1
+        self.evict()
+
+    def _write(self, key, ext, data):
+        # Write to temporary file and rename, so readers never see half-written entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._path(key, ext))
+
+    def evict(self):
+        # Remove least recently used entries until total size is within max_bytes
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            if self.total_bytes <= self.max_bytes:
+                return
+            victims = []
+            for key, (size, used) in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+                if self.total_bytes <= self.max_bytes:
+                    break
+                victims.append(key)
+                self.total_bytes -= size
+                del self._index[key]
+        for key in victims:
+            for ext in ('.body', '.json'):
+                try:
+                    os.remove(self._path(key, ext))
+                except FileNotFoundError:
+                    pass
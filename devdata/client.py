@@ -0,0 +1,217 @@
+"""
+Shared HTTP client for all scripts. Every fetch should go through it, so that
+connections to api.open.undp.org, unstats.un.org, etc. are kept alive and reused,
+requests have timeouts, and failures are retried with exponential backoff.
+
+    from devdata.client import get_client, try_get
+    r = get_client().get("https://api.open.undp.org/api/units/operating-unit-index.json")
+    try_rec = try_get(url)      # {'code': "Ok" or "Error", 'result': response or error message}
+"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from devdata.ratelimit import get_rate_limiter
+from devdata.telemetry import get_telemetry
+
+# Status codes worth another attempt: throttling and transient server errors
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def retry_after_seconds(value):
+    """
+    Parse Retry-After header, which is either number of seconds or HTTP date
+    Return seconds to wait or None if header is missing or unreadable
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class HttpClient:
+    """
+    Pooled HTTP client with keep-alive, timeouts and retries.
+      timeout--(connect, read) timeouts in seconds
+      retries--number of retries after the first attempt
+      backoff--base delay in seconds, attempt n waits backoff * 2**n plus jitter
+      backoff_max--maximum delay between attempts, also caps Retry-After
+      pool_size--number of kept-alive connections per host
+      limiter--HostLimiter to cap simultaneous requests per host, None for no cap
+      rate_limiter--AdaptiveRateLimiter for requests per second per host, None for no limit
+      cache--HttpCache for conditional GET requests, None for no cache
+      headers--extra headers sent with every request
+      telemetry--Telemetry to record every attempt in, shared telemetry if None
+    Session is shared by all threads.
+    """
+    def __init__(self, timeout=(10, 60), retries=3, backoff=1.0, backoff_max=120.0,
+                 pool_size=32, limiter=None, cache=None, headers=None, telemetry=None, rate_limiter=None):
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.telemetry = telemetry
+        self.cache = cache
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.limiter = limiter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # requests decodes gzip/deflate transparently, ask for it explicitly
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        if headers:
+            self.session.headers.update(headers)
+
+    def delay(self, attempt, response=None):
+        # Seconds to wait before next attempt, Retry-After wins if server sent it
+        if response is not None:
+            wait = retry_after_seconds(response.headers.get("Retry-After"))
+            if wait is not None:
+                return min(wait, self.backoff_max)
+        return min(self.backoff_max, self.backoff * 2 ** attempt) + random.uniform(0, self.backoff)
+
+    def send(self, method, url, **kwargs):
+        # Single attempt, under per-host cap and rate if there are limiters, recorded in telemetry
+        kwargs.setdefault("timeout", self.timeout)
+        telemetry = self.telemetry or get_telemetry()
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(url)
+        start = time.perf_counter()
+        try:
+            if self.limiter is None:
+                response = self.session.request(method, url, **kwargs)
+            else:
+                with self.limiter.slot(url):
+                    response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            telemetry.request(url, "error", time.perf_counter() - start)
+            if self.rate_limiter is not None:
+                self.rate_limiter.feedback(url, "error", time.perf_counter() - start)
+            raise
+        if self.rate_limiter is not None:
+            self.rate_limiter.feedback(url, response.status_code, time.perf_counter() - start,
+                                       retry_after_seconds(response.headers.get("Retry-After")))
+        body = kwargs.get("data") or kwargs.get("json")
+        telemetry.request(url, response.status_code, time.perf_counter() - start,
+                          0 if kwargs.get("stream") else len(response.content),
+                          len(body) if isinstance(body, (bytes, str)) else 0)
+        return response
+
+    def request(self, method, url, retries=None, verbose=False, **kwargs):
+        """
+        Make request, retry on connection errors, timeouts and RETRY_STATUS
+        With cache, GET of cached url is conditional and 304 Not Modified is served
+        from cache as 200 with attribute from_cache=True
+        Return last response, whatever its status code is
+        Raise requests.exceptions.RequestException if no response after all attempts
+        """
+        if self.cache is None or method != "GET" or kwargs.get("stream"):
+            return self.retry(method, url, retries, verbose, **kwargs)
+        headers = kwargs.pop("headers", None) or {}
+        validators = self.cache.validators(url)
+        response = self.retry(method, url, retries, verbose, headers={**validators, **headers}, **kwargs)
+        if response.status_code == 304 and validators:
+            cached = self.cache.response(url)
+            if cached is not None:
+                return cached
+            # Entry evicted meanwhile, get it again without validators
+            response = self.retry(method, url, retries, verbose, headers=headers, **kwargs)
+        self.cache.store(url, response)
+        return response
+
+    def retry(self, method, url, retries=None, verbose=False, **kwargs):
+        # Make request with retries, see request()
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            try:
+                response = self.send(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                if attempt >= retries:
+                    raise
+                (self.telemetry or get_telemetry()).retry(url, type(err).__name__)
+                wait = self.delay(attempt)
+                if verbose:
+                    print("%s, retrying %s in %.1f s" % (err, url, wait))
+            else:
+                if response.status_code not in RETRY_STATUS or attempt >= retries:
+                    return response
+                (self.telemetry or get_telemetry()).retry(url, response.status_code)
+                wait = self.delay(attempt, response)
+                if verbose:
+                    print("Status %d, retrying %s in %.1f s" % (response.status_code, url, wait))
+                response.close()
+            time.sleep(wait)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def try_get(self, url, ntries=None, verbose=False, **kwargs):
+        """
+        Try to get url, ntries attempts in total (client default if None)
+        return {'code': result code, "Ok" if Ok, "Error" else
+                'result': response if Ok, error message else}
+        """
+        retries = None if ntries is None else max(ntries - 1, 0)
+        if verbose:
+            print("Trying %s" % url)
+        try:
+            result = self.get(url, retries=retries, verbose=verbose, **kwargs)
+            result.raise_for_status()
+            code = "Ok"
+        except requests.exceptions.HTTPError as errh:
+            code = "Error"
+            result = "Http Error: %s" % errh
+        except requests.exceptions.ConnectionError as errc:
+            code = "Error"
+            result = "Error Connecting: %s" % errc
+        except requests.exceptions.Timeout as errt:
+            code = "Error"
+            result = "Timeout Error: %s" % errt
+        except requests.exceptions.RequestException as err:
+            code = "Error"
+            result = "Oops: Something Else %s" % err
+        if verbose and code == "Error":
+            print(result)
+        return {'code': code, 'result': result}
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    # Shared client, created with defaults and shared rate limiter on first use
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(rate_limiter=get_rate_limiter())
+        return _client
+
+
+def set_client(client):
+    # Replace shared client, e.g. with one configured with a HostLimiter
+    global _client
+    with _client_lock:
+        _client = client
+    return client
+
+
+def try_get(url, ntries=None, verbose=False, **kwargs):
+    # try_get() on the shared client
+    return get_client().try_get(url, ntries=ntries, verbose=verbose, **kwargs)
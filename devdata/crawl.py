@@ -0,0 +1,152 @@
+"""
+Concurrent crawling helpers: a thread pool whose tasks can submit further tasks,
+and per-host caps on the number of simultaneous requests.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from devdata.telemetry import get_telemetry
+
+
+def url_host(url):
+    # Host part of url, lowercased, used as a key for per-host limits
+    return urlsplit(url).netloc.lower()
+
+
+class HostLimiter:
+    """
+    Limit number of simultaneous requests to each host.
+      default--limit for hosts which are not listed in caps
+      caps--dictionary {host: limit}, e.g. {"api.open.undp.org": 16}
+    Use as
+      with limiter.slot(url):
+          r = requests.get(url)
+    """
+    def __init__(self, default=4, caps=None):
+        self.default = default
+        self.caps = {h.lower(): n for h, n in (caps or {}).items()}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def slot(self, url):
+        host = url_host(url)
+        with self._lock:
+            sem = self._slots.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.caps.get(host, self.default))
+                self._slots[host] = sem
+        return sem
+
+
+def task_ok(result):
+    # Tasks return 0, "Ok" or None if successful, error code or "Error" else
+    return result in (0, "Ok", None)
+
+
+class TaskGroup:
+    """
+    Count tasks of a group, e.g. all projects and documents of an operating unit.
+    on_done(ok) is called once, when group is closed and all its tasks are finished;
+    ok is False if any task failed.
+    """
+    def __init__(self, on_done):
+        self.on_done = on_done
+        self._pending = 0
+        self._closed = False
+        self._ok = True
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self._pending += 1
+
+    def finish(self, ok=True):
+        with self._lock:
+            self._pending -= 1
+            self._ok = self._ok and ok
+            fire = self._closed and self._pending == 0
+        if fire:
+            self.on_done(self._ok)
+
+    def close(self):
+        # No more tasks will be added
+        with self._lock:
+            self._closed = True
+            fire = self._pending == 0
+        if fire:
+            self.on_done(self._ok)
+
+    def run(self, fn, *args, **kwargs):
+        # Run task now, counting it in group
+        self.add()
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = task_ok(result)
+            return result
+        finally:
+            self.finish(ok)
+
+
+class Crawler:
+    """
+    Thread pool for crawling. Tasks may submit further tasks (e.g. a project task
+    submits its documents), join() waits until there is nothing left to do.
+      workers--number of worker threads
+    Per-host caps are applied by HttpClient, give it a HostLimiter.
+    """
+    def __init__(self, workers=16, verbose=False):
+        self.verbose = verbose
+        self.errors = []
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending = 0
+        self._cond = threading.Condition()
+
+    def submit(self, fn, *args, group=None, **kwargs):
+        """
+        Submit task fn(*args, **kwargs), count it in TaskGroup group if given
+        """
+        with self._cond:
+            self._pending += 1
+            get_telemetry().gauge('crawler_pending', self._pending)
+        if group is not None:
+            group.add()
+            future = self._executor.submit(self._run_in_group, group, fn, *args, **kwargs)
+        else:
+            future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._task_done)
+        return future
+
+    @staticmethod
+    def _run_in_group(group, fn, *args, **kwargs):
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = task_ok(result)
+            return result
+        finally:
+            group.finish(ok)
+
+    def _task_done(self, future):
+        exc = None if future.cancelled() else future.exception()
+        with self._cond:
+            if exc is not None:
+                self.errors.append(exc)
+                if self.verbose:
+                    print(f"! Task failed: {exc!r}")
+            self._pending -= 1
+            get_telemetry().gauge('crawler_pending', self._pending)
+            if self._pending == 0:
+                self._cond.notify_all()
+
+    def join(self):
+        """
+        Wait for all submitted tasks, including tasks submitted by tasks, and stop workers
+        Return list of exceptions raised by tasks
+        """
+        with self._cond:
+            while self._pending:
+                self._cond.wait()
+        self._executor.shutdown()
+        return self.errors
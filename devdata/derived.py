@@ -0,0 +1,164 @@
+"""
+Derived indicators of a Panel, computed for all countries and series at once with numpy:
+latest available value, growth over period, linear interpolation of missing years and
+distance to target. Arrays are [country, series] unless said otherwise.
+
+Rules come from series metadata, list of {'code', 'name', ...} as get_UNSTAT_meta() returns,
+and from rules dictionary {series code: rule}; a rule of SL_TLF_UEM applies to SL_TLF_UEM_15+_FEMALE.
+Rule keys:
+  growth--"cagr" (compound annual growth rate) or "diff" (change per year); series with
+          percent or proportion in name default to "diff"
+  target--target value, direction--"up" if target is reached from below, "down" else
+  max_gap--longest run of missing years that is interpolated, None for any
+
+    metrics = derive(panel, meta=UNSTAT_meta, rules={"SI_POV_DAY1": {"target": 0, "direction": "down"}})
+    metrics['latest'][panel.country_index["KAZ"], panel.series_index["SI_POV_DAY1"]]
+"""
+import re
+
+from devdata.panel import np, _require_numpy
+
+PERCENT_NAME = re.compile(r'\(%\)|percent|proportion|share|rate\b', re.IGNORECASE)
+
+
+def series_rule(series, rules):
+    # Rule of series, looked up by longest series code which is a prefix of series
+    parts = series.split('_')
+    for k in range(len(parts), 0, -1):
+        code = '_'.join(parts[:k])
+        if code in rules:
+            return rules[code]
+    return {}
+
+
+def resolve_rules(panel, meta=None, rules=None):
+    """
+    Return list of rules, one per series of panel, with defaults from metadata names
+    """
+    names = {m['code']: m.get('name', '') for m in (meta or [])}
+    resolved = []
+    for s in panel.series:
+        rule = dict(series_rule(s, rules or {}))
+        if 'growth' not in rule:
+            rule['growth'] = "diff" if PERCENT_NAME.search(names.get(s, '')) else "cagr"
+        resolved.append(rule)
+    return resolved
+
+
+def latest(values, mask=None):
+    """
+    Latest available value along year axis of values[country, year, series]
+    Return (values[country, series], year indexes[country, series], -1 if no data)
+    """
+    mask = ~np.isnan(values) if mask is None else mask
+    n_years = values.shape[1]
+    last = n_years - 1 - np.argmax(mask[:, ::-1, :], axis=1)
+    has = mask.any(axis=1)
+    idx = np.where(has, last, -1)
+    vals = np.take_along_axis(values, np.maximum(idx, 0)[:, None, :], axis=1)[:, 0, :]
+    return np.where(has, vals, np.nan), idx
+
+
+def earliest(values, mask=None):
+    # Earliest available value, as latest()
+    mask = ~np.isnan(values) if mask is None else mask
+    has = mask.any(axis=1)
+    idx = np.where(has, np.argmax(mask, axis=1), -1)
+    vals = np.take_along_axis(values, np.maximum(idx, 0)[:, None, :], axis=1)[:, 0, :]
+    return np.where(has, vals, np.nan), idx
+
+
+def interpolate(values, years=None, max_gap=None):
+    """
+    Fill missing years between available ones linearly, years before first and after
+    last available value stay missing
+      years--year labels, array of length of year axis; consecutive years if None
+      max_gap--longest run of missing years to fill, scalar or array[series]; None for any
+    """
+    n_years = values.shape[1]
+    t = np.arange(n_years, dtype=np.float64) if years is None else np.asarray(years, dtype=np.float64)
+    mask = ~np.isnan(values)
+    pos = np.arange(n_years)[None, :, None]
+    prev = np.maximum.accumulate(np.where(mask, pos, -1), axis=1)
+    nxt = np.minimum.accumulate(np.where(mask, pos, n_years)[:, ::-1, :], axis=1)[:, ::-1, :]
+    inside = ~mask & (prev >= 0) & (nxt < n_years)
+    if max_gap is not None:
+        gap = np.asarray(max_gap, dtype=np.float64)
+        inside &= (nxt - prev - 1) <= (gap[None, None, :] if gap.ndim else gap)
+    p, n = np.clip(prev, 0, n_years - 1), np.clip(nxt, 0, n_years - 1)
+    v_prev = np.take_along_axis(values, p, axis=1)
+    v_next = np.take_along_axis(values, n, axis=1)
+    t_prev, t_next = t[p], t[n]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        filled = v_prev + (v_next - v_prev) * (t[None, :, None] - t_prev) / (t_next - t_prev)
+    return np.where(inside, filled, values)
+
+
+def growth(values, years=None, kind=None):
+    """
+    Growth between earliest and latest available values of values[country, year, series]
+      kind--array[series] of "cagr" or "diff", all "cagr" if None
+    CAGR is NaN unless both values are positive; both are NaN with fewer than two years of data
+    """
+    t = np.arange(values.shape[1], dtype=np.float64) if years is None else np.asarray(years, dtype=np.float64)
+    v0, i0 = earliest(values)
+    v1, i1 = latest(values)
+    span = np.where((i0 >= 0) & (i1 > i0), t[np.maximum(i1, 0)] - t[np.maximum(i0, 0)], np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # 1.0 ** nan is 1 in numpy, so a single observation needs its own check
+        cagr = np.where((v0 > 0) & (v1 > 0) & np.isfinite(span) & (span > 0), (v1 / v0) ** (1.0 / span) - 1.0,
+                        np.nan)
+        diff = (v1 - v0) / span
+    if kind is None:
+        return cagr
+    use_diff = (np.asarray(kind) == "diff")[None, :]
+    return np.where(use_diff, diff, cagr)
+
+
+def target_distance(latest_values, target, direction):
+    """
+    Distance of latest values to targets
+      target--array[series], NaN for series without target
+      direction--array[series] of 1 for "up" and -1 for "down"
+    Return gap[country, series], positive if target is not reached, 0 if it is
+    """
+    gap = (target[None, :] - latest_values) * direction[None, :]
+    return np.maximum(gap, 0.0)
+
+
+def derive(panel, meta=None, rules=None, period=None):
+    """
+    Compute derived indicators of panel
+      meta--list of series metadata as returned by get_UNSTAT_meta(), names select growth kind
+      rules--{series code: rule}, see module description
+      period--(first year, last year) for latest value and growth, all years if None
+    Return dictionary of arrays:
+      'filled'--panel values[country, year, series] with gaps interpolated
+      'latest', 'latest_year'--latest value and its year, from filled values
+      'growth'--CAGR or change per year over period
+      'target_gap'--distance to target, NaN for series without target
+    """
+    _require_numpy()
+    resolved = resolve_rules(panel, meta, rules)
+    years = np.asarray(panel.years, dtype=np.float64)
+    max_gap = np.array([np.inf if r.get('max_gap') is None else r['max_gap'] for r in resolved])
+    filled = interpolate(panel.values, years, max_gap) if panel.values.size else panel.values
+    window = filled
+    if period is not None:
+        keep = (years >= period[0]) & (years <= period[1])
+        window = filled[:, keep, :]
+        years = years[keep]
+    if not window.size:
+        empty = np.full((len(panel.countries), len(panel.series)), np.nan)
+        return {'filled': filled, 'latest': empty, 'latest_year': empty.copy(),
+                'growth': empty.copy(), 'target_gap': empty.copy()}
+    last, idx = latest(window)
+    latest_year = np.where(idx >= 0, years[np.maximum(idx, 0)], np.nan)
+    kind = np.array([r['growth'] for r in resolved])
+    target = np.array([r.get('target', np.nan) for r in resolved], dtype=np.float64)
+    direction = np.array([-1.0 if r.get('direction') == "down" else 1.0 for r in resolved])
+    return {'filled': filled,
+            'latest': last,
+            'latest_year': latest_year,
+            'growth': growth(window, years, kind),
+            'target_gap': target_distance(last, target, direction)}
@@ -0,0 +1,229 @@
+"""
+Full-text index of downloaded UNDP project documents. Text is extracted from documents under
+{ou}/{project}/{title}/ of a snapshot folder in a pool of processes and put into an SQLite
+FTS5 inverted index, on disk, with operating unit, project id and document title of every file.
+Each distinct file content is extracted and indexed once, by its SHA-256, so copies of the same
+document in many projects or snapshots cost nothing; update() only extracts new files and
+drops removed ones. Documents kept as MANIFEST.tsv lines of a BlobStore are read from the store.
+
+PDF needs pypdf; DOCX, HTML and text files are read with the standard library.
+
+    index = DocumentIndex("UNDP Documents.index.sqlite")
+    index.update("UNDP Projects 2020-12-03", blob_dir="UNDP Documents", workers=8)
+    index.search('"gender equality" Kazakhstan')
+"""
+import hashlib
+import html
+import os
+import re
+import sqlite3
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from devdata.blobs import MANIFEST
+from devdata.undp import safe_name
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+# Extensions text is extracted from
+TEXT_TYPES = ('.pdf', '.docx', '.htm', '.html', '.txt', '.csv')
+TAG = re.compile(r'<[^>]+>')
+QUERY_PART = re.compile(r'"([^"]+)"|(\S+)')
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def extract_text(path):
+    """
+    Text of document at path by its extension
+    Return text, None if type is not supported; raise ImportError if it needs a missing library
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.pdf':
+        if PdfReader is None:
+            raise ImportError("PDF text extraction requires pypdf")
+        return "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    if ext == '.docx':
+        with zipfile.ZipFile(path) as z:
+            xml = z.read("word/document.xml").decode('utf-8', errors='replace')
+        return html.unescape(TAG.sub('', re.sub(r'</w:p>|<w:tab/>|<w:br/>', '\n', xml)))
+    if ext in ('.htm', '.html'):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return html.unescape(TAG.sub(' ', f.read()))
+    if ext in ('.txt', '.csv'):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    return None
+
+
+def _extract(job):
+    # Worker of process pool: (sha256, path) -> (sha256, text or None, error or None)
+    digest, path = job
+    try:
+        return digest, extract_text(path), None
+    except ImportError as err:
+        return digest, None, "missing: %s" % err
+    except Exception as err:
+        return digest, None, "%s: %s" % (type(err).__name__, err)
+
+
+def fts_query(query):
+    """
+    FTS5 query of keywords and "quoted phrases", all of which must match:
+    every word is quoted, so punctuation in it is not taken as query syntax
+    """
+    parts = []
+    for phrase, word in QUERY_PART.findall(query):
+        parts.append('"%s"' % (phrase or word).replace('"', ''))
+    return " ".join(parts)
+
+
+class DocumentIndex:
+    """
+    On-disk full-text index.
+      path--SQLite file
+    Tables: docs, one row per file path with ou, project, title and content id;
+    contents, one row per SHA-256; text, FTS5 index of contents keyed by content id.
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS contents (id INTEGER PRIMARY KEY, sha256 TEXT UNIQUE NOT NULL, "
+                        "chars INTEGER, error TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS docs (path TEXT PRIMARY KEY, ou TEXT, project TEXT, title TEXT, "
+                        "size INTEGER, mtime REAL, content_id INTEGER)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS docs_content ON docs (content_id)")
+        self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS text USING fts5(body, content='', "
+                        "tokenize='unicode61 remove_diacritics 2')")
+        self.db.commit()
+
+    @staticmethod
+    def project_titles(store, ou, project):
+        # {(safe title folder, safe file name): title} from document_name of project record
+        titles = {}
+        p_data = store.load('project', ou, project) if store is not None else None
+        documents = (p_data or {}).get('document_name') or [[], []]
+        for title, url in zip(documents[0], documents[1]):
+            titles[(safe_name(title), safe_name(re.split('/', url)[-1]))] = title
+        return titles
+
+    def scan(self, root, blob_dir=None, store=None):
+        """
+        Yield (path relative to root, file to read, ou, project, title, sha256 or None) of documents in root.
+        Titles come from project records in store (devdata.store), from folder names if not found
+        """
+        for ou in sorted(os.listdir(root)):
+            ou_dir = os.path.join(root, ou)
+            if not os.path.isdir(ou_dir):
+                continue
+            for project in sorted(os.listdir(ou_dir)):
+                prj_dir = os.path.join(ou_dir, project)
+                if not os.path.isdir(prj_dir):
+                    continue
+                titles = self.project_titles(store, ou, project)
+                for title_dir in sorted(os.listdir(prj_dir)):
+                    doc_dir = os.path.join(prj_dir, title_dir)
+                    if not os.path.isdir(doc_dir):
+                        continue
+                    for fname in sorted(os.listdir(doc_dir)):
+                        rel = os.path.join(ou, project, title_dir, fname)
+                        title = titles.get((title_dir, fname), title_dir)
+                        if fname == MANIFEST and blob_dir is not None:
+                            with open(os.path.join(doc_dir, fname), 'r', encoding='utf-8') as f:
+                                for line in f:
+                                    name, digest, _ = line.rstrip('\n').split('\t', 2)
+                                    yield (os.path.join(ou, project, title_dir, name),
+                                           os.path.join(blob_dir, "objects", digest[:2], digest), ou, project,
+                                           titles.get((title_dir, name), title_dir), digest)
+                        elif os.path.splitext(fname)[1].lower() in TEXT_TYPES:
+                            yield rel, os.path.join(doc_dir, fname), ou, project, title, None
+
+    def update(self, root, blob_dir=None, store=None, workers=None, verbose=False):
+        """
+        Bring index up to date with documents in root, extracting text of new contents on workers processes
+        (number of CPUs if None). Documents indexed before and no longer in root are dropped
+        Return (number of files added or changed, number of contents extracted, number of files removed)
+        """
+        known = {row[0]: (row[1], row[2]) for row in self.db.execute("SELECT path, size, mtime FROM docs")}
+        have = {row[0]: row[1] for row in self.db.execute("SELECT sha256, id FROM contents")}
+        seen = set()
+        changed = []
+        jobs = {}
+        for rel, fname, ou, project, title, digest in self.scan(root, blob_dir, store):
+            seen.add(rel)
+            if not os.path.isfile(fname):
+                continue
+            st = os.stat(fname)
+            if known.get(rel) == (st.st_size, st.st_mtime):
+                continue
+            digest = digest or file_sha256(fname)
+            changed.append((rel, ou, project, title, st.st_size, st.st_mtime, digest))
+            if digest not in have:
+                jobs.setdefault(digest, fname)
+        n_extracted = 0
+        if jobs:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for n, (digest, text, error) in enumerate(pool.map(_extract, jobs.items(), chunksize=4)):
+                    if error is not None and error.startswith("missing"):
+                        # Retried once the library is installed
+                        if verbose:
+                            print("  Skipping %s, %s" % (jobs[digest], error))
+                        continue
+                    with self._lock:
+                        cur = self.db.execute("INSERT INTO contents (sha256, chars, error) VALUES (?, ?, ?)",
+                                              (digest, None if text is None else len(text), error))
+                        have[digest] = cur.lastrowid
+                        if text:
+                            self.db.execute("INSERT INTO text (rowid, body) VALUES (?, ?)", (cur.lastrowid, text))
+                        if n % 100 == 99:
+                            self.db.commit()
+                    n_extracted += 1
+                    if verbose and error:
+                        print("  Cannot extract %s: %s" % (jobs[digest], error))
+        removed = [p for p in known if p not in seen]
+        with self._lock:
+            self.db.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                [(rel, ou, project, title, size, mtime, have[digest])
+                                 for rel, ou, project, title, size, mtime, digest in changed if digest in have])
+            self.db.executemany("DELETE FROM docs WHERE path=?", [(p,) for p in removed])
+            self.db.commit()
+        return len(changed), n_extracted, len(removed)
+
+    def search(self, query, limit=20, raw=False):
+        """
+        Documents matching all keywords and "quoted phrases" of query, best first
+          raw--query is in FTS5 syntax, e.g. 'poverty NEAR(rural women, 5) NOT "annual report"'
+        Return list of {'ou', 'project', 'title', 'path', 'score'}, several files of one content are all listed
+        """
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT d.ou, d.project, d.title, d.path, m.score FROM "
+                "(SELECT rowid, bm25(text) AS score FROM text WHERE text MATCH ? ORDER BY score LIMIT ?) m "
+                "JOIN docs d ON d.content_id = m.rowid ORDER BY m.score, d.path",
+                (query if raw else fts_query(query), limit)).fetchall()
+        return [{'ou': ou, 'project': project, 'title': title, 'path': path, 'score': -score}
+                for ou, project, title, path, score in rows]
+
+    def stats(self):
+        # (number of files, number of distinct contents, number of contents with text)
+        with self._lock:
+            return (self.db.execute("SELECT COUNT(*) FROM docs").fetchone()[0],
+                    self.db.execute("SELECT COUNT(*) FROM contents").fetchone()[0],
+                    self.db.execute("SELECT COUNT(*) FROM contents WHERE chars > 0").fetchone()[0])
+
+    def close(self):
+        with self._lock:
+            self.db.commit()
+            self.db.close()
@@ -0,0 +1,159 @@
+"""
+Streaming, resumable file downloads. Body is written in chunks to {dest}.part,
+an interrupted download is resumed with HTTP Range request, and only complete
+file with verified size (and checksum, if known) is renamed to dest.
+
+    res = download_file(url, "PAL/00057409/Project Document/prodoc.pdf")
+    res['code']     # "Ok" or "Error"
+"""
+import hashlib
+import json
+import os
+import re
+
+import requests
+
+from devdata.client import get_client
+from devdata.telemetry import get_telemetry
+
+CHUNK_SIZE = 1 << 16
+
+
+def _read_part_meta(part):
+    try:
+        with open(part + '.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _hash_file(path, h):
+    # Feed existing file into hash h
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h
+
+
+def _total_size(response, offset):
+    # Expected size of complete file from Content-Range or Content-Length, None if unknown
+    content_range = response.headers.get('Content-Range')
+    if content_range:
+        m = re.match(r'bytes \d+-\d+/(\d+)', content_range)
+        if m:
+            return int(m.group(1))
+    if 'Content-Length' in response.headers and 'Content-Encoding' not in response.headers:
+        return offset + int(response.headers['Content-Length'])
+    return None
+
+
+def download_file(url, dest, client=None, sha256=None, chunk_size=CHUNK_SIZE, attempts=3, validators=None,
+                  use_cache=True, verbose=False):
+    """
+    Download url to dest without buffering it in memory
+    Input:
+      url--file url
+      dest--file name, folder must exist
+      client--HttpClient, shared client if None. Its cache is used to revalidate
+              files downloaded before
+      sha256--expected hex digest, not checked if None
+      attempts--number of times to resume a broken transfer
+      validators--conditional request headers, e.g. {'If-None-Match': etag}, instead of client cache;
+                  if file didn't change, nothing is written and 'not_modified' is True
+      use_cache--False to neither revalidate with nor store to client cache
+    Return {'code': "Ok" or "Error",
+            'result': dest if Ok, error message else,
+            'bytes': bytes transferred, 'sha256': digest of file, 'from_cache': True if not changed,
+            'headers': ETag and Last-Modified of response}
+    """
+    client = client if client is not None else get_client()
+    part = dest + '.part'
+    transferred = 0
+    revalidate = use_cache and client.cache is not None and validators is None
+    for attempt in range(attempts):
+        offset = os.path.getsize(part) if os.path.isfile(part) else 0
+        part_meta = _read_part_meta(part) if offset else {}
+        # Ranges must refer to bytes of the file, not of compressed body
+        headers = {'Accept-Encoding': 'identity'}
+        if offset:
+            # Resume only if file didn't change since part was started
+            headers['Range'] = 'bytes=%d-' % offset
+            validator = part_meta.get('ETag') or part_meta.get('Last-Modified')
+            if validator:
+                headers['If-Range'] = validator
+        elif validators:
+            headers.update(validators)
+        elif revalidate:
+            headers.update(client.cache.validators(url))
+        try:
+            r = client.get(url, stream=True, headers=headers)
+        except requests.exceptions.RequestException as err:
+            return {'code': "Error", 'result': "Error Connecting: %s" % err, 'bytes': transferred}
+        with r:
+            if r.status_code == 304 and validators and not offset:
+                return {'code': "Ok", 'result': None, 'bytes': transferred, 'not_modified': True}
+            if r.status_code == 304 and revalidate:
+                if client.cache.copy_to(url, dest):
+                    return {'code': "Ok", 'result': dest, 'bytes': transferred,
+                            'sha256': _hash_file(dest, hashlib.sha256()).hexdigest(), 'from_cache': True}
+                # Entry evicted meanwhile, get it again without validators
+                revalidate = False
+                continue
+            if r.status_code == 416 and offset:
+                # Range not satisfiable, part is stale or complete--start over
+                _remove(part, part + '.json')
+                continue
+            if r.status_code not in (200, 206):
+                return {'code': "Error", 'result': "Http Error: %d for url: %s" % (r.status_code, url),
+                        'bytes': transferred}
+            if r.status_code == 200:
+                # Server sent whole file
+                offset = 0
+                with open(part + '.json', 'w', encoding='utf-8') as f:
+                    json.dump({h: r.headers[h] for h in ('ETag', 'Last-Modified') if h in r.headers}, f)
+            elif verbose:
+                print("      Resuming %s from byte %d" % (url, offset))
+            total = _total_size(r, offset)
+            h = _hash_file(part, hashlib.sha256()) if offset else hashlib.sha256()
+            before = transferred
+            try:
+                with open(part, 'ab' if offset else 'wb') as f:
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        h.update(chunk)
+                        transferred += len(chunk)
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as err:
+                if verbose:
+                    print("      Transfer of %s broken: %s" % (url, err))
+                continue
+            finally:
+                get_telemetry().received(url, transferred - before)
+                get_telemetry().write('download', 0, transferred - before)
+            response_headers = r.headers
+        size = os.path.getsize(part)
+        if total is not None and size != total:
+            if verbose:
+                print("      Got %d bytes of %d for %s" % (size, total, url))
+            continue
+        digest = h.hexdigest()
+        if sha256 is not None and digest != sha256.lower():
+            _remove(part, part + '.json')
+            return {'code': "Error", 'result': "Checksum mismatch for url: %s" % url, 'bytes': transferred}
+        os.replace(part, dest)
+        _remove(part + '.json')
+        get_telemetry().write('download', 1, 0)
+        if use_cache and client.cache is not None:
+            client.cache.store_file(url, response_headers, dest)
+        return {'code': "Ok", 'result': dest, 'bytes': transferred, 'sha256': digest, 'from_cache': False,
+                'headers': {h: response_headers[h] for h in ('ETag', 'Last-Modified') if h in response_headers}}
+    return {'code': "Error", 'result': "Incomplete download after %d attempts: %s" % (attempts, url),
+            'bytes': transferred}
@@ -0,0 +1,218 @@
+"""
+Catalog of results indicators of UNDP projects with near-duplicate wordings merged, requires numpy.
+
+Indicator strings of indicators.ndjson (or Parquet folder) written by Access UNDP Project Results.py
+are normalized and interned, so each distinct wording is handled once. Wordings are compared with
+MinHash signatures of character shingles, computed for all wordings at once, and locality-sensitive
+hashing: only wordings sharing a band of signature are compared, so time grows about linearly with
+number of wordings instead of quadratically. Wordings with estimated Jaccard similarity above
+threshold are merged with union-find.
+
+    catalog = build_catalog(iter_indicator_records("indicators.ndjson"), threshold=0.6)
+    write_catalog(catalog, "indicator-catalog")
+"""
+import json
+import os
+import re
+import shutil
+import sys
+import zlib
+
+from devdata.sinks import open_writer
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Numbering and bullets at start of indicator, e.g. "1.", "(a)", "ii)", "-", "Indicator 2.1:"
+NUMBERING = re.compile(r'^(?:\s*(?:indicator\s*)?(?:\(?(?:[0-9]+(?:\.[0-9]+)*|[a-z]|[ivx]+)[.):]|[-*•–·])\s*)+')
+NON_WORD = re.compile(r'[^\w%]+')
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Indicator catalog requires numpy, install it")
+
+
+def normalize(text):
+    # Lower case wording without numbering, punctuation and extra spaces, interned
+    text = NUMBERING.sub('', text.strip().lower())
+    return sys.intern(NON_WORD.sub(' ', text).strip())
+
+
+def iter_indicator_records(path):
+    """
+    Yield records {'operating_unit_id', 'project', 'output', 'indicator_title', 'indicators'}
+    from indicators.ndjson, or from folder of Parquet parts (requires pyarrow)
+    """
+    if os.path.isdir(path):
+        import pyarrow.dataset as ds
+        for batch in ds.dataset(path, format='parquet').to_batches():
+            yield from batch.to_pylist()
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def shingles(text, k=5):
+    # crc32 hashes of character k-grams of text, text itself if it is shorter
+    data = text.encode('utf-8')
+    if len(data) <= k:
+        return {zlib.crc32(data)}
+    return {zlib.crc32(data[i:i+k]) for i in range(len(data) - k + 1)}
+
+
+def minhash(texts, num_perm=64, k=5, seed=1):
+    """
+    MinHash signatures of texts, array[text, num_perm] of uint32
+    All shingles go into one array, each permutation is one vectorized pass over it
+    """
+    _require_numpy()
+    sets = [np.fromiter(shingles(t, k), dtype=np.uint64) for t in texts]
+    lengths = np.array([len(s) for s in sets], dtype=np.int64)
+    flat = np.concatenate(sets) if sets else np.zeros(0, dtype=np.uint64)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(sets) else np.zeros(0, dtype=np.int64)
+    rng = np.random.RandomState(seed)
+    a = rng.randint(0, 1 << 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.randint(0, 1 << 63, size=num_perm, dtype=np.uint64)
+    sig = np.empty((len(texts), num_perm), dtype=np.uint32)
+    for j in range(num_perm):
+        # Multiply-shift hashing: a*x+b wraps around 2**64, its high 32 bits are the hash
+        hashed = ((a[j] * flat + b[j]) >> np.uint64(32)).astype(np.uint32)
+        sig[:, j] = np.minimum.reduceat(hashed, starts) if len(flat) else 0
+    return sig
+
+
+def lsh_bands(num_perm, threshold):
+    # (bands, rows) with bands*rows == num_perm whose LSH threshold (1/bands)**(1/rows) is closest to threshold
+    options = [(num_perm // r, r) for r in range(1, num_perm + 1) if num_perm % r == 0]
+    return min(options, key=lambda br: abs((1.0 / br[0]) ** (1.0 / br[1]) - threshold))
+
+
+def cluster(sig, threshold=0.6):
+    """
+    Cluster rows of MinHash signatures: rows sharing a band are candidates, candidate is merged
+    with the first row of its bucket if share of equal signature values is at least threshold,
+    and with its cluster if the same holds for first rows of both clusters
+    Return array[row] of cluster labels, label is the smallest row of cluster
+    """
+    n, num_perm = sig.shape
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    bands, rows = lsh_bands(num_perm, threshold)
+    for band in range(bands):
+        part = np.ascontiguousarray(sig[:, band*rows:(band+1)*rows])
+        keys = part.view(np.dtype((np.void, part.dtype.itemsize * rows))).ravel()
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        rep = first[inverse.ravel()]
+        candidates = np.nonzero(rep != np.arange(n))[0]
+        if not len(candidates):
+            continue
+        similar = (sig[candidates] == sig[rep[candidates]]).mean(axis=1) >= threshold
+        for i, j in zip(candidates[similar].tolist(), rep[candidates[similar]].tolist()):
+            ri, rj = find(i), find(j)
+            # Clusters are merged only if their first rows are similar too, so that
+            # chains of small changes don't join unrelated wordings
+            if ri != rj and (ri == i and rj == j or np.count_nonzero(sig[ri] == sig[rj]) >= threshold * num_perm):
+                parent[max(ri, rj)] = min(ri, rj)
+    return np.array([find(i) for i in range(n)], dtype=np.int64)
+
+
+def build_catalog(records, threshold=0.6, num_perm=64, k=5, verbose=False):
+    """
+    Build catalog of indicators from result records
+    Return list of clusters, largest first:
+      {'id', 'indicator'--most frequent original wording, 'variants'--normalized wordings,
+       'count'--number of occurrences, 'occurrences'--list of (operating_unit_id, project, output, wording)}
+    """
+    _require_numpy()
+    index = {}
+    wordings = []
+    occurrences = []
+    originals = []
+    for rec in records:
+        for raw in rec.get('indicators') or []:
+            norm = normalize(raw)
+            if not norm:
+                continue
+            i = index.get(norm)
+            if i is None:
+                i = index[norm] = len(wordings)
+                wordings.append(norm)
+                originals.append({})
+            original = sys.intern(raw.strip())
+            originals[i][original] = originals[i].get(original, 0) + 1
+            occurrences.append((i, sys.intern(str(rec.get('operating_unit_id'))), rec.get('project'),
+                                rec.get('output'), original))
+    if verbose:
+        print("%d occurrences, %d distinct wordings" % (len(occurrences), len(wordings)))
+    if not wordings:
+        return []
+    labels = cluster(minhash(wordings, num_perm, k), threshold)
+    clusters = {}
+    for i, label in enumerate(labels.tolist()):
+        clusters.setdefault(label, []).append(i)
+    occ_by_wording = {}
+    for i, ou, project, output, original in occurrences:
+        occ_by_wording.setdefault(i, []).append((ou, project, output, original))
+    catalog = []
+    for members in clusters.values():
+        counts = {}
+        for i in members:
+            for original, n in originals[i].items():
+                counts[original] = counts.get(original, 0) + n
+        occ = [o for i in members for o in occ_by_wording[i]]
+        catalog.append({'indicator': min(counts, key=lambda w: (-counts[w], len(w), w)),
+                        'variants': sorted(wordings[i] for i in members),
+                        'count': len(occ),
+                        'occurrences': occ})
+    catalog.sort(key=lambda c: (-c['count'], c['indicator']))
+    for n, c in enumerate(catalog):
+        c['id'] = n + 1
+    if verbose:
+        print("%d indicators after merging near-duplicates" % len(catalog))
+    return catalog
+
+
+def _output(name, format):
+    # File or folder open_writer() writes for name
+    return name + ".ndjson" if format == "ndjson" else name
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.isfile(path):
+        os.remove(path)
+
+
+def write_catalog(catalog, name, format="ndjson"):
+    """
+    Write {name} with one record per indicator {'id', 'indicator', 'count', 'variants'} and
+    {name}-occurrences with one record per occurrence {'id', 'operating_unit_id', 'project', 'output', 'wording'},
+    see devdata.sinks.open_writer for formats. Both are written under .tmp names and replace
+    catalog of previous run when complete
+    """
+    names = (name, name + "-occurrences")
+    for n in names:
+        _remove(_output(n + ".tmp", format))
+    with open_writer(name + ".tmp", format) as f_cat, open_writer(name + "-occurrences.tmp", format) as f_occ:
+        for c in catalog:
+            f_cat.write({'id': c['id'], 'indicator': c['indicator'], 'count': c['count'], 'variants': c['variants']})
+            for ou, project, output, wording in c['occurrences']:
+                f_occ.write({'id': c['id'], 'operating_unit_id': ou, 'project': project, 'output': output,
+                             'wording': wording})
+    for n in names:
+        if format != "ndjson":
+            # Folder of Parquet parts cannot be replaced over an existing one
+            _remove(_output(n, format))
+        os.replace(_output(n + ".tmp", format), _output(n, format))
@@ -0,0 +1,264 @@
+"""
+In-memory store of indicator observations of all sources, keyed by (ISO3, series, year).
+Country codes of sources are harmonized to ISO3: UNSD M49 codes through M49-ISO.txt,
+UNDP operating units through operating unit index, WDI uses ISO3 already.
+Observations are kept in array columns, with hash indexes on country, series, year and
+(country, series), so a query touches only matching rows instead of scanning files.
+
+    codes = CountryCodes.from_files("UNSD_SDGs/M49-ISO.txt")
+    store = IndicatorStore(codes)
+    store.load_sdg_tsv("UNSD_SDGs/Data/UNSTAT-ALL-DATA.tsv")
+    store.load_wdi_dir("WorldBank_WDI/Data-WB")
+    store.set_goals({s['code']: s['goal'] for s in series})
+    rows = store.query(countries=["KAZ"], goal="1", years=(2010, 2019))
+"""
+import csv
+import os
+import re
+from array import array
+from collections import defaultdict
+
+
+class CountryCodes:
+    """
+    Map country codes of sources to ISO3
+      m49--dictionary {M49 code: ISO3}
+      units--dictionary {UNDP operating unit id: ISO3}
+    """
+    def __init__(self, m49=None, units=None):
+        self.m49 = dict(m49 or {})
+        self.units = dict(units or {})
+        self.iso3_m49 = {iso3: m49 for m49, iso3 in self.m49.items()}
+
+    @classmethod
+    def from_files(cls, m49_file, units=None):
+        """
+        Read M49-ISO.txt, tab separated M49 code and ISO3
+        units--operating unit index as returned by load_operating_units(), optional
+        """
+        m49 = {}
+        with open(m49_file, "r") as f:
+            for line in f:
+                codes = re.split(r'\t', line)
+                if len(codes) > 1 and codes[0].strip().isdigit():
+                    m49[int(codes[0])] = codes[1].strip()
+        codes = cls(m49)
+        if units:
+            codes.add_units(units)
+        return codes
+
+    def add_units(self, units):
+        # Operating units have ISO3 id, e.g. KAZ, or iso3 field; regional units are kept as is
+        for ou in units:
+            self.units[ou['id']] = (ou.get('iso3') or ou['id']).upper()
+
+    def iso3(self, code, system="iso3"):
+        """
+        ISO3 code of country code in system: "iso3", "m49" or "undp"
+        Return None if code is not known
+        """
+        if system == "m49":
+            return self.m49.get(int(code))
+        if system == "undp":
+            return self.units.get(code)
+        return code.upper() if code else None
+
+    def to_m49(self, iso3):
+        return self.iso3_m49.get(iso3)
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class IndicatorStore:
+    """
+    Observations (ISO3, series, year, value, source). Country and series names are interned
+    to integer ids, columns are arrays of ids, years and values.
+      codes--CountryCodes used by loaders of M49 and UNDP data
+    """
+    def __init__(self, codes=None):
+        self.codes = codes or CountryCodes()
+        self.countries = []
+        self.series = []
+        self.sources = []
+        self._country_id = {}
+        self._series_id = {}
+        self._source_id = {}
+        self.country = array('i')
+        self.series_col = array('i')
+        self.year = array('h')
+        self.value = array('d')
+        self.source = array('b')
+        self._by_country = defaultdict(lambda: array('i'))
+        self._by_series = defaultdict(lambda: array('i'))
+        self._by_year = defaultdict(lambda: array('i'))
+        self._by_cs = defaultdict(lambda: array('i'))
+        self._goals = {}
+        self._series_goals = {}
+        self._goal_series = {}
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self.value)
+
+    @staticmethod
+    def _intern(name, names, ids):
+        i = ids.get(name)
+        if i is None:
+            i = ids[name] = len(names)
+            names.append(name)
+        return i
+
+    def add(self, iso3, series, year, value, source=""):
+        # Add one observation, value must be a number
+        row = len(self.value)
+        c = self._intern(iso3, self.countries, self._country_id)
+        s = self._intern(series, self.series, self._series_id)
+        self.country.append(c)
+        self.series_col.append(s)
+        self.year.append(int(year))
+        self.value.append(value)
+        self.source.append(self._intern(source, self.sources, self._source_id))
+        self._by_country[c].append(row)
+        self._by_series[s].append(row)
+        self._by_year[int(year)].append(row)
+        self._by_cs[(c, s)].append(row)
+
+    def set_goals(self, goals):
+        """
+        Set goals of series, dictionary {series code: list of goals} as in Series/List.
+        Series with dimensions in code, e.g. SL_TLF_UEM_15+_FEMALE, belong to goals of their series
+        """
+        self._goals = {code: [str(g) for g in gs] for code, gs in goals.items()}
+        self._series_goals = {}
+        self._goal_series = {}
+
+    def series_goals(self, series):
+        # Goals of series, looked up by longest series code which is a prefix of series
+        if series not in self._series_goals:
+            parts = series.split('_')
+            goals = []
+            for k in range(len(parts), 0, -1):
+                code = '_'.join(parts[:k])
+                if code in self._goals:
+                    goals = self._goals[code]
+                    break
+            self._series_goals[series] = goals
+        return self._series_goals[series]
+
+    def goal_series(self, goal):
+        # Series of goal, kept until series are added or goals change
+        key = (str(goal), len(self.series))
+        if key not in self._goal_series:
+            self._goal_series[key] = [s for s in self.series if str(goal) in self.series_goals(s)]
+        return self._goal_series[key]
+
+    def rows(self, countries=None, series=None, years=None, goal=None):
+        """
+        Return list of row numbers of observations for countries (ISO3), series and years
+        years--(first, last), inclusive
+        goal--keep only series of goal, see set_goals()
+        None means any
+        """
+        if goal is not None:
+            goal_series = set(self.goal_series(goal))
+            series = list(goal_series) if series is None else [s for s in series if s in goal_series]
+        c_ids = None if countries is None else [self._country_id[c] for c in countries if c in self._country_id]
+        s_ids = None if series is None else [self._series_id[s] for s in series if s in self._series_id]
+        if c_ids is not None and s_ids is not None:
+            candidates = [r for c in c_ids for s in s_ids for r in self._by_cs.get((c, s), ())]
+        elif c_ids is not None:
+            candidates = [r for c in c_ids for r in self._by_country.get(c, ())]
+        elif s_ids is not None:
+            candidates = [r for s in s_ids for r in self._by_series.get(s, ())]
+        elif years is not None:
+            return [r for y in range(years[0], years[1] + 1) for r in self._by_year.get(y, ())]
+        else:
+            return list(range(len(self.value)))
+        if years is not None:
+            first, last = years
+            candidates = [r for r in candidates if first <= self.year[r] <= last]
+        return candidates
+
+    def record(self, row):
+        # Observation of row as (ISO3, series, year, value)
+        return (self.countries[self.country[row]], self.series[self.series_col[row]], self.year[row], self.value[row])
+
+    def query(self, countries=None, series=None, years=None, goal=None):
+        # List of observations (ISO3, series, year, value), arguments as in rows()
+        return [self.record(r) for r in self.rows(countries, series, years, goal)]
+
+    def get(self, iso3, series, year):
+        # Value of observation, None if there is none; first one if there are several
+        c, s = self._country_id.get(iso3), self._series_id.get(series)
+        for r in self._by_cs.get((c, s), ()):
+            if self.year[r] == year:
+                return self.value[r]
+        return None
+
+    def load_sdg_tsv(self, path, source="UNSD"):
+        """
+        Load UNSTAT-ALL-DATA.tsv or a series .tsv: ISO3, series, year, value, dimensions
+        Rows with non-numeric value, e.g. "<5", are counted in skipped
+        Return number of rows added
+        """
+        n = 0
+        with open(path, "r") as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                value = to_float(fields[3]) if len(fields) > 3 else None
+                year = to_float(fields[2]) if len(fields) > 2 else None
+                if value is None or year is None or fields[0] in ('', 'None'):
+                    self.skipped += 1
+                    continue
+                self.add(fields[0], fields[1], year, value, source)
+                n += 1
+        return n
+
+    def load_wdi_dir(self, data_dir, source="WDI"):
+        """
+        Load {series.id}.csv files written by Get WB Data
+        Return number of rows added
+        """
+        n = 0
+        for name in sorted(os.listdir(data_dir)):
+            if not name.endswith('.csv'):
+                continue
+            with open(os.path.join(data_dir, name), "r", encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f):
+                    value = to_float(row['value'])
+                    year = to_float(row['year'])
+                    if value is None or year is None:
+                        self.skipped += 1
+                        continue
+                    self.add(row['country.code'], row['series.id'], year, value, source)
+                    n += 1
+        return n
+
+    def load_undp_projects(self, projects, fields=('budget', 'expenditure'), source="UNDP"):
+        """
+        Add yearly totals of project outputs by operating unit as series UNDP_BUDGET, UNDP_EXPENDITURE, etc.
+        projects--iterable of (operating unit id, project record) as saved by get_project_data_file();
+                  outputs with 'fiscal_year' and field values, single values or lists by year
+        Return number of rows added
+        """
+        totals = defaultdict(float)
+        for ou, prj in projects:
+            iso3 = self.codes.iso3(ou, "undp") or ou
+            for output in prj.get('outputs') or []:
+                years = output.get('fiscal_year')
+                years = years if isinstance(years, list) else [years]
+                for field in fields:
+                    values = output.get(field)
+                    values = values if isinstance(values, list) else [values]
+                    for y, v in zip(years, values):
+                        y, v = to_float(y), to_float(v)
+                        if y is not None and v is not None:
+                            totals[(iso3, "UNDP_" + field.upper(), int(y))] += v
+        for (iso3, series, year), value in totals.items():
+            self.add(iso3, series, year, value, source)
+        return len(totals)
@@ -0,0 +1,99 @@
+"""
+Progress journal: append-only log of completed work items, e.g. operating units,
+projects, output results and documents. A restarted run skips items found in the
+journal, so there is no need to edit skip_to by hand after a crash.
+
+Each line is kind and key parts separated by tabs. Lines are appended with a single
+write to a file opened with O_APPEND, so several threads or processes can share one
+journal; refresh() picks up lines appended by other processes.
+
+    set_journal(Journal("crawl-progress.log"))
+    if not get_journal().done('project', ou_id, project_id):
+        ...
+        get_journal().mark('project', ou_id, project_id)
+"""
+import os
+import threading
+
+
+class Journal:
+    """
+    Journal of completed items.
+      path--journal file, None to keep journal in memory only
+      fsync--sync file to disk after each line, survives power loss but is slower
+    """
+    def __init__(self, path=None, fsync=False):
+        self.path = os.path.abspath(path) if path else None
+        self.fsync = fsync
+        self._done = set()
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._fd = None
+        if self.path is not None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self.refresh()
+
+    @staticmethod
+    def _key(kind, key):
+        return tuple(str(k).replace('\t', ' ').replace('\n', ' ') for k in (kind,) + key)
+
+    def refresh(self):
+        # Read lines appended since last read, including those written by other processes
+        if self.path is None:
+            return
+        with self._lock:
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+            # Ignore incomplete last line, it is read next time
+            end = data.rfind(b'\n') + 1
+            self._offset += end
+            for line in data[:end].decode('utf-8').splitlines():
+                if line:
+                    self._done.add(tuple(line.split('\t')))
+
+    def done(self, kind, *key):
+        # True if item was marked as completed
+        return self._key(kind, key) in self._done
+
+    def mark(self, kind, *key):
+        # Mark item as completed
+        item = self._key(kind, key)
+        with self._lock:
+            if item in self._done:
+                return
+            self._done.add(item)
+            if self._fd is not None:
+                line = '\t'.join(item) + '\n'
+                os.write(self._fd, line.encode('utf-8'))
+                if self.fsync:
+                    os.fsync(self._fd)
+
+    def count(self, kind):
+        with self._lock:
+            return sum(1 for item in self._done if item[0] == kind)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    # Shared journal, in memory only if not set
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = Journal()
+        return _journal
+
+
+def set_journal(journal):
+    global _journal
+    with _journal_lock:
+        _journal = journal
+    return journal
@@ -0,0 +1,338 @@
+"""
+Local stand-ins for open.undp.org, unstats.un.org and api.worldbank.org, to measure and
+check the pipelines without hitting live servers.
+
+MockServer replays responses from a FixtureStore, a folder of recorded responses, and
+answers requests without a recording from a synthetic responder with the same layout
+as the live API. Latency, server errors and 429 Too Many Requests can be injected.
+redirect() sends requests of a client for a live host to a mock server, so the code
+under test runs unchanged; record() saves live responses to a FixtureStore.
+
+    with MockServer(undp_responder(FixtureStore("fixtures/undp")), latency=0.05, throttle_rate=0.01) as undp:
+        redirect(get_client(), {"https://api.open.undp.org": undp.url})
+        get_unit_projects({'id': 'U000', 'name': 'Unit 0'})
+
+Endpoints: units/operating-unit-index.json, units/{ou}.json, projects/{id}.json,
+v1/output/{id}/results; SDG Series/List, Series/{code}/Dimensions,
+Series/{code}/GeoArea/{m49}/DataSlice, Series/Data; WDI country/{iso3;...}/indicator/{id;...}.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from requests.adapters import HTTPAdapter
+
+UNDP_HOST = "https://api.open.undp.org"
+SDG_HOST = "https://unstats.un.org"
+WB_HOST = "https://api.worldbank.org"
+
+
+def fixture_key(path, query=""):
+    # Key of request: path and query with sorted parameters
+    return path + ("?" + urlencode(sorted(parse_qsl(query, keep_blank_values=True))) if query else "")
+
+
+class FixtureStore:
+    """
+    Recorded responses, {directory}/{sha256 of key}.body and .json with key, status and content type
+      directory--folder of fixtures, created if it doesn't exist
+    """
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def lookup(self, path, query=""):
+        # Return (status, content type, body) or None if not recorded
+        base = self._path(fixture_key(path, query))
+        if not os.path.isfile(base + ".json"):
+            return None
+        with open(base + ".json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(base + ".body", "rb") as f:
+            return meta['status'], meta['content_type'], f.read()
+
+    def save(self, path, query, status, content_type, body):
+        key = fixture_key(path, query)
+        base = self._path(key)
+        with open(base + ".body", "wb") as f:
+            f.write(body)
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump({'key': key, 'status': status, 'content_type': content_type}, f)
+
+
+def json_response(data, status=200):
+    return status, "application/json", json.dumps(data).encode('utf-8')
+
+
+def chain(*responders):
+    # Responder trying responders in order, e.g. fixtures first and synthetic data for the rest
+    def respond(path, query):
+        for responder in responders:
+            if responder is None:
+                continue
+            res = responder(path, query)
+            if res is not None:
+                return res
+        return None
+    return respond
+
+
+def fixture_responder(store):
+    return None if store is None else store.lookup
+
+
+def synthetic_undp(n_units=5, n_projects=20, n_outputs=2, n_results=3):
+    """
+    Responder with n_units operating units U000..., n_projects projects per unit,
+    n_outputs outputs per project and n_results results per output
+    """
+    def respond(path, query):
+        m = re.fullmatch(r'/api/units/operating-unit-index\.json', path)
+        if m:
+            return json_response([{'id': "U%03d" % u, 'name': "Unit %d" % u} for u in range(n_units)])
+        m = re.fullmatch(r'/api/units/U(\d+)\.json', path)
+        if m and int(m.group(1)) < n_units:
+            u = int(m.group(1))
+            return json_response({'id': "U%03d" % u, 'projects': [
+                {'id': "%04d%04d" % (u, p), 'title': "Project %d of unit %d" % (p, u)} for p in range(n_projects)]})
+        m = re.fullmatch(r'/api/projects/(\d{4})(\d{4})\.json', path)
+        if m and int(m.group(1)) < n_units and int(m.group(2)) < n_projects:
+            pid = m.group(1) + m.group(2)
+            return json_response({'project_id': pid, 'operating_unit': "U" + m.group(1)[1:],
+                                  'document_name': [[], [], []],
+                                  'outputs': [{'output_id': "%s%02d" % (pid, o), 'fiscal_year': ["2019", "2020"],
+                                               'budget': [1000.0 * (o + 1), 1200.0 * (o + 1)],
+                                               'expenditure': [900.0 * (o + 1), 1100.0 * (o + 1)]}
+                                              for o in range(n_outputs)]})
+        m = re.fullmatch(r'/api/v1/output/(\d{8})(\d{2})/results', path)
+        if m:
+            return json_response({'data': [{'project': m.group(1), 'output': m.group(1) + m.group(2),
+                                            'indicator_title': "Indicator %d" % r,
+                                            'indicator_description': "1. Baseline\n2. Target %d" % r}
+                                           for r in range(n_results)]})
+        return None
+    return respond
+
+
+def synthetic_sdg(n_series=20, years=range(2000, 2020), dims=(('Sex', ('FEMALE', 'MALE')),), goals=("1", "17"),
+                  page_size_max=100000):
+    """
+    Responder with n_series series SE_0..., each with dims, one observation per year per
+    combination of dimension codes for any country
+    """
+    combos = [{}]
+    for name, codes in dims:
+        combos = [dict(c, **{name: code}) for c in combos for code in codes]
+
+    def records(series, area):
+        return [dict({'timePeriodStart': float(y), 'value': str(round((int(area) % 97) + y / 100.0, 2))},
+                     **dict(c, **{'Reporting Type': 'G'})) for y in years for c in combos]
+
+    def respond(path, query):
+        if path == "/SDGAPI/v1/sdg/Series/List":
+            return json_response([{'code': "SE_%d" % i, 'description': "Series %d" % i, 'goal': [goals[i % len(goals)]],
+                                   'indicator': ["%s.1.1" % goals[i % len(goals)]], 'release': "2020.Q2.G.01"}
+                                  for i in range(n_series)])
+        m = re.fullmatch(r'/SDGAPI/v1/sdg/Series/(SE_\d+)/Dimensions', path)
+        if m:
+            return json_response([{'id': name, 'codes': [{'code': c, 'description': c.title()} for c in codes]}
+                                  for name, codes in dims] + [{'id': 'Reporting Type', 'codes': [{'code': 'G'}]}])
+        m = re.fullmatch(r'/SDGAPI/v1/sdg/Series/(SE_\d+)/GeoArea/(\d+)/DataSlice', path)
+        if m:
+            return json_response({'dimensions': records(m.group(1), m.group(2))})
+        if path == "/SDGAPI/v1/sdg/Series/Data":
+            params = parse_qsl(query)
+            series = [v for k, v in params if k == 'seriesCode']
+            areas = [v for k, v in params if k == 'areaCode']
+            q = dict(params)
+            page, size = int(q.get('page', 1)), min(int(q.get('pageSize', 25)), page_size_max)
+            n_per = len(years) * len(combos)
+            total = len(series) * len(areas) * n_per
+            data = []
+            cached = {}
+            for k in range((page - 1) * size, min(page * size, total)):
+                s, a, r = series[k // (len(areas) * n_per)], areas[(k // n_per) % len(areas)], k % n_per
+                if (s, a) not in cached:
+                    cached[(s, a)] = records(s, a)
+                rec = dict(cached[(s, a)][r])
+                data.append({'series': s, 'geoAreaCode': a, 'timePeriodStart': rec.pop('timePeriodStart'),
+                             'value': rec.pop('value'), 'dimensions': rec})
+            return json_response({'totalElements': total, 'totalPages': (total + size - 1) // size,
+                                  'pageNumber': page, 'data': data})
+        return None
+    return respond
+
+
+def synthetic_wdi(years=range(1998, 2020)):
+    # Responder with one value per year for any indicator and ISO3 country, null every 5th year
+    def respond(path, query):
+        m = re.fullmatch(r'/v2/country/([^/]+)/indicator/([^/]+)', path)
+        if not m:
+            return None
+        q = dict(parse_qsl(query))
+        countries, indicators = m.group(1).split(';'), m.group(2).split(';')
+        first, last = (int(y) for y in q['date'].split(':')) if 'date' in q else (years[0], years[-1])
+        ys = [y for y in years if first <= y <= last]
+        total = len(indicators) * len(countries) * len(ys)
+        size, page = int(q.get('per_page', 50)), int(q.get('page', 1))
+        recs = []
+        for k in range((page - 1) * size, min(page * size, total)):
+            i, c, y = indicators[k // (len(countries) * len(ys))], countries[(k // len(ys)) % len(countries)], ys[k % len(ys)]
+            recs.append({'indicator': {'id': i, 'value': i}, 'country': {'id': c[:2], 'value': c},
+                         'countryiso3code': c, 'date': str(y), 'value': None if y % 5 == 0 else y / 10.0})
+        return json_response([{'page': page, 'pages': max(1, (total + size - 1) // size), 'per_page': size,
+                               'total': total}, recs])
+    return respond
+
+
+def undp_responder(store=None, **kwargs):
+    return chain(fixture_responder(store), synthetic_undp(**kwargs))
+
+
+def sdg_responder(store=None, **kwargs):
+    return chain(fixture_responder(store), synthetic_sdg(**kwargs))
+
+
+def wdi_responder(store=None, **kwargs):
+    return chain(fixture_responder(store), synthetic_wdi(**kwargs))
+
+
+class MockServer:
+    """
+    HTTP server on localhost answering with responder(path, query) -> (status, content type, body) or None
+      latency--seconds added to every response, plus uniform jitter up to jitter seconds
+      error_rate--share of requests answered with 503
+      throttle_rate--share of requests answered with 429 and Retry-After: retry_after
+      seed--seed of random faults, for reproducible runs
+    Counts requests, bytes and status codes sent; use as context manager or start()/stop()
+    """
+    def __init__(self, responder, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=1,
+                 seed=None):
+        self.responder = responder
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.bytes = 0
+        self.statuses = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self._server.server_port
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.handle(self)
+
+            def log_message(self, *args):
+                pass
+        return Handler
+
+    def handle(self, req):
+        with self._lock:
+            roll = self._random.random()
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        headers = {}
+        if roll < self.throttle_rate:
+            status, ctype, body = 429, "text/plain", b"Too Many Requests"
+            headers["Retry-After"] = str(self.retry_after)
+        elif roll < self.throttle_rate + self.error_rate:
+            status, ctype, body = 503, "text/plain", b"Service Unavailable"
+        else:
+            parts = urlsplit(req.path)
+            res = self.responder(parts.path, parts.query)
+            status, ctype, body = res if res is not None else (404, "text/plain", b"Not Found")
+        req.send_response(status)
+        req.send_header("Content-Type", ctype)
+        req.send_header("Content-Length", str(len(body)))
+        for k, v in headers.items():
+            req.send_header(k, v)
+        req.end_headers()
+        req.wfile.write(body)
+        with self._lock:
+            self.requests += 1
+            self.bytes += len(body)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MockServer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class RedirectAdapter(HTTPAdapter):
+    # Adapter sending requests for prefix to target instead
+    def __init__(self, prefix, target, **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = prefix.rstrip('/')
+        self.target = target.rstrip('/')
+
+    def send(self, request, **kwargs):
+        request.url = self.target + request.url[len(self.prefix):]
+        return super().send(request, **kwargs)
+
+
+def redirect(client, targets):
+    """
+    Send requests of HttpClient client for live hosts to mock servers
+      targets--{live prefix: mock url}, e.g. {"https://api.open.undp.org": server.url}
+    """
+    for prefix, target in targets.items():
+        client.session.mount(prefix.rstrip('/') + '/', RedirectAdapter(prefix, target))
+
+
+class RecordingAdapter(HTTPAdapter):
+    # Adapter saving responses to FixtureStore as they come
+    def __init__(self, store, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+
+    def send(self, request, **kwargs):
+        kwargs['stream'] = False
+        response = super().send(request, **kwargs)
+        parts = urlsplit(request.url)
+        self.store.save(parts.path, parts.query, response.status_code,
+                        response.headers.get('Content-Type', 'application/octet-stream'), response.content)
+        return response
+
+
+def record(client, prefixes, store):
+    """
+    Save responses of client for live prefixes, e.g. ["https://unstats.un.org"], to FixtureStore store
+    Responses are saved decoded, as requests returns them
+    """
+    for prefix in prefixes:
+        client.session.mount(prefix.rstrip('/') + '/', RecordingAdapter(store))
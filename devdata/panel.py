@@ -0,0 +1,180 @@
+"""
+Country x year x series panels built in one vectorized pass, requires numpy; pandas is needed
+only for SDG tables and to_frame().
+
+    panel = panel_from_store(store, countries=["KAZ", "AUS"], years=(2000, 2019))
+    panel = panel_from_sdg(read_sdg("Data/parquet", goal="8"), pivot={"SL_TLF_UEM": ["Age", "Sex"]})
+    panel.values[panel.country_index["KAZ"], :, panel.series_index["SL_TLF_UEM_15+_FEMALE"]]
+    print(panel.coverage_by_series())
+
+Cells without observations are NaN, panel.mask shows which cells have data; if several
+observations fall into one cell (e.g. a dimension that is not pivoted) their mean is taken
+and panel.counts shows how many there were.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Panels require numpy, install it")
+
+
+class Panel:
+    """
+    Dense panel values[country, year, series] with labels
+      countries, years, series--labels of axes
+      counts--number of observations in each cell, 0 for missing
+    """
+    def __init__(self, values, counts, countries, years, series):
+        self.values = values
+        self.counts = counts
+        self.countries = list(countries)
+        self.years = list(years)
+        self.series = list(series)
+        self.country_index = {c: i for i, c in enumerate(self.countries)}
+        self.year_index = {y: i for i, y in enumerate(self.years)}
+        self.series_index = {s: i for i, s in enumerate(self.series)}
+
+    @property
+    def mask(self):
+        # True for cells with data
+        return self.counts > 0
+
+    def masked(self):
+        # numpy masked array, missing cells are masked
+        return np.ma.masked_array(self.values, mask=~self.mask)
+
+    @property
+    def coverage(self):
+        # Share of cells with data
+        return float(self.mask.mean()) if self.counts.size else 0.0
+
+    @property
+    def duplicates(self):
+        # Number of cells with more than one observation
+        return int((self.counts > 1).sum())
+
+    def coverage_by_series(self):
+        # {series: share of country x year cells with data}
+        share = self.mask.mean(axis=(0, 1)) if self.counts.size else []
+        return dict(zip(self.series, (float(x) for x in share)))
+
+    def coverage_by_country(self):
+        # {country: share of year x series cells with data}
+        share = self.mask.mean(axis=(1, 2)) if self.counts.size else []
+        return dict(zip(self.countries, (float(x) for x in share)))
+
+    def to_frame(self):
+        # pandas DataFrame indexed by (country, year), one column per series
+        import pandas as pd
+        index = pd.MultiIndex.from_product([self.countries, self.years], names=['iso3', 'year'])
+        return pd.DataFrame(self.values.reshape(len(self.countries) * len(self.years), len(self.series)),
+                            index=index, columns=self.series)
+
+
+def _axis(codes, keep):
+    # Labels and index of codes in labels; codes not in keep get -1
+    labels, inverse = np.unique(codes, return_inverse=True)
+    if keep is not None:
+        found = set(labels.tolist())
+        keep_labels = [k for k in keep if k in found]
+        pos = {k: i for i, k in enumerate(keep_labels)}
+        remap = np.array([pos.get(x, -1) for x in labels.tolist()], dtype=np.int64)
+        return keep_labels, remap[inverse] if len(remap) else inverse
+    return labels.tolist(), inverse
+
+
+def build_panel(countries, years, series, values, keep_countries=None, keep_series=None, year_range=None):
+    """
+    Build Panel from equal length arrays of country codes, years, series codes and values
+    keep_countries, keep_series--lists of labels to keep, in this order; None for all found
+    year_range--(first, last) inclusive, None for first to last year found
+    """
+    _require_numpy()
+    countries = np.asarray(countries)
+    series = np.asarray(series)
+    years = np.asarray(years, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    ok = ~np.isnan(values) & ~np.isnan(years)
+    years = np.where(ok, years, 0).astype(np.int64)
+    if year_range is None and ok.any():
+        # All years from first to last, years without any data are kept as empty cells
+        year_range = (int(years[ok].min()), int(years[ok].max()))
+    if year_range is not None:
+        ok &= (years >= year_range[0]) & (years <= year_range[1])
+        year_labels = list(range(year_range[0], year_range[1] + 1))
+        yi = years - year_range[0]
+    else:
+        year_labels, yi = [], np.zeros(len(years), dtype=np.int64)
+    c_labels, ci = _axis(countries, keep_countries)
+    s_labels, si = _axis(series, keep_series)
+    ok &= (ci >= 0) & (si >= 0)
+    shape = (len(c_labels), len(year_labels), len(s_labels))
+    flat = np.ravel_multi_index((ci[ok], yi[ok], si[ok]), shape) if ok.any() else np.array([], dtype=np.int64)
+    size = shape[0] * shape[1] * shape[2]
+    counts = np.bincount(flat, minlength=size)
+    sums = np.bincount(flat, weights=values[ok], minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        panel = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    return Panel(panel.reshape(shape), counts.reshape(shape), c_labels, [int(y) for y in year_labels], s_labels)
+
+
+def panel_from_store(store, countries=None, series=None, years=None):
+    """
+    Build Panel from IndicatorStore, columns of store are used as they are, without copying rows
+    countries, series--lists to keep, None for all
+    years--(first, last), None for all
+    """
+    _require_numpy()
+    c_ids = np.frombuffer(store.country, dtype=np.int32) if len(store) else np.array([], dtype=np.int32)
+    s_ids = np.frombuffer(store.series_col, dtype=np.int32) if len(store) else np.array([], dtype=np.int32)
+    c_names = np.array(store.countries, dtype=object)
+    s_names = np.array(store.series, dtype=object)
+    return build_panel(c_names[c_ids].astype(str), np.frombuffer(store.year, dtype=np.int16) if len(store) else [],
+                       s_names[s_ids].astype(str), np.frombuffer(store.value, dtype=np.float64) if len(store) else [],
+                       keep_countries=countries, keep_series=series, year_range=years)
+
+
+def pivot_series(frame, pivot, series_column='series_code'):
+    """
+    Series labels of SDG rows with dimensions pivoted into code, as series_unique() does
+      frame--pandas DataFrame with series_column and dimension columns
+      pivot--{series code: list of dimensions}, e.g. dim_aggrs, or list of dimensions for all series
+    Return pandas Series of labels, e.g. SL_TLF_UEM_15+_FEMALE
+    """
+    codes = frame[series_column].astype(str)
+    labels = codes.copy()
+    if not pivot:
+        return labels
+    if not isinstance(pivot, dict):
+        pivot = {s: list(pivot) for s in codes.unique()}
+    for code, dims in pivot.items():
+        rows = codes.index[codes == code]
+        if not len(rows):
+            continue
+        key = labels.loc[rows]
+        for dim in dims:
+            if dim in frame.columns:
+                key = key + "_" + frame.loc[rows, dim].astype(str).str.strip()
+        labels.loc[rows] = key
+    return labels
+
+
+def panel_from_sdg(table, pivot=None, countries=None, series=None, years=None, series_column='series_code'):
+    """
+    Build Panel from SDG rows with dimension columns, e.g. read_sdg() table or DataFrame
+      pivot--dimensions pivoted into series, see pivot_series(); other dimensions are averaged
+      countries, series--lists to keep, series as pivoted labels; None for all
+      years--(first, last), None for all
+    """
+    _require_numpy()
+    frame = table.to_pandas() if hasattr(table, 'to_pandas') else table
+    if series_column not in frame.columns:
+        series_column = 'series'
+    labels = pivot_series(frame, pivot, series_column)
+    return build_panel(frame['iso3'].astype(str).to_numpy(), frame['year'].to_numpy(),
+                       labels.to_numpy(dtype=str), frame['value'].astype('float64').to_numpy(),
+                       keep_countries=countries, keep_series=series, year_range=years)
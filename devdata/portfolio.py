@@ -0,0 +1,209 @@
+"""
+Compact in-memory model of the UNDP project portfolio of a snapshot. Projects are __slots__
+records with scalar fields and budget and expenditure totals; outputs, documents and all other
+fields are kept as compact (optionally compressed) json bytes and parsed only when accessed.
+Codes which repeat across projects, e.g. operating unit ids, donors, SDG ids and document
+formats, are interned, so each distinct code is held once.
+
+    portfolio = Portfolio.from_store(get_store())
+    portfolio.get("KAZ", "00057409").outputs[0].budget
+    sum(p.budget for p in portfolio.by_ou("KAZ"))
+"""
+import json
+import sys
+import zlib
+from array import array
+
+from devdata.store import get_store
+
+# Fields whose values are codes, interned when parsed
+CODE_FIELDS = frozenset(('operating_unit', 'operating_unit_id', 'iati_op_id', 'inst_id', 'donor_id', 'donor_short',
+                         'donor_name', 'sdg_id', 'sdg_name', 'focus_area', 'focus_area_descr', 'crs', 'crs_descr',
+                         'gender_id', 'gender_descr', 'fiscal_year', 'region_id', 'country_iso3'))
+# Fields of project which get their own slots, the rest is kept in Project.extra
+PROJECT_FIELDS = ('project_id', 'id', 'project_title', 'title', 'start', 'end', 'outputs', 'document_name')
+
+
+def intern_codes(d):
+    # Intern string values, or lists of them, of CODE_FIELDS of dictionary d
+    for k, v in d.items():
+        if k in CODE_FIELDS:
+            if isinstance(v, str):
+                d[k] = sys.intern(v)
+            elif isinstance(v, list):
+                d[k] = [sys.intern(x) if isinstance(x, str) else x for x in v]
+    return d
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def pack(data, compress):
+    # Compact json bytes of data, zlib compressed if compress
+    raw = json.dumps(data, separators=(',', ':')).encode('ascii')
+    return zlib.compress(raw, 1) if compress else raw
+
+
+def unpack(raw):
+    if raw is None:
+        return None
+    if raw[:1] == b'\x78':
+        # zlib header, json never starts with 'x'
+        raw = zlib.decompress(raw)
+    return json.loads(raw, object_hook=intern_codes)
+
+
+class Output:
+    """
+    Project output parsed from project record
+      years--array of fiscal years, budget, expenditure--arrays of amounts by year
+      donors, sdgs--tuples of interned codes
+      extra--dictionary of all other fields
+    """
+    __slots__ = ('id', 'title', 'years', 'budget', 'expenditure', 'donors', 'sdgs', 'extra')
+
+    def __init__(self, d):
+        self.id = d.pop('output_id', None)
+        self.title = d.pop('output_title', None) or d.pop('award_title', None)
+        self.years = array('h', [int(to_float(y)) for y in as_list(d.pop('fiscal_year', []))])
+        self.budget = array('d', [to_float(v) for v in as_list(d.pop('budget', []))])
+        self.expenditure = array('d', [to_float(v) for v in as_list(d.pop('expenditure', []))])
+        self.donors = tuple(x for x in as_list(d.pop('donor_short', None) or d.pop('donor_id', None) or []) if x)
+        self.sdgs = tuple(x for x in as_list(d.pop('sdg_id', [])) if x)
+        self.extra = d
+
+    def __repr__(self):
+        return "Output(%r, %r)" % (self.id, self.title)
+
+
+class Project:
+    """
+    Project with scalar fields in slots; outputs, documents and extra are parsed on every access,
+    keep the returned value if it is used many times
+      budget, expenditure--totals over outputs and years
+    """
+    __slots__ = ('ou', 'id', 'title', 'start', 'end', 'budget', 'expenditure', 'n_outputs',
+                 '_outputs', '_documents', '_extra')
+
+    def __init__(self, ou, record, compress=False):
+        self.ou = sys.intern(str(ou))
+        self.id = sys.intern(str(record.get('project_id') or record.get('id') or ''))
+        self.title = record.get('project_title') or record.get('title')
+        self.start = record.get('start')
+        self.end = record.get('end')
+        outputs = record.get('outputs') or []
+        self.budget = sum(to_float(v) for o in outputs for v in as_list(o.get('budget', [])))
+        self.expenditure = sum(to_float(v) for o in outputs for v in as_list(o.get('expenditure', [])))
+        self.n_outputs = len(outputs)
+        self._outputs = pack(outputs, compress) if outputs else None
+        documents = record.get('document_name')
+        self._documents = pack(documents, compress) if documents and documents[0] else None
+        extra = {k: v for k, v in record.items() if k not in PROJECT_FIELDS}
+        self._extra = pack(extra, compress) if extra else None
+
+    @property
+    def outputs(self):
+        return [Output(o) for o in unpack(self._outputs) or []]
+
+    @property
+    def documents(self):
+        # List of (title, url, format), format is interned
+        documents = unpack(self._documents) or [[], [], []]
+        formats = documents[2] if len(documents) > 2 else []
+        return [(title, url, sys.intern(formats[i]) if i < len(formats) and formats[i] else None)
+                for i, (title, url) in enumerate(zip(documents[0], documents[1]))]
+
+    @property
+    def extra(self):
+        # Dictionary of fields which are not in slots, e.g. project_descr, inst_id
+        return unpack(self._extra) or {}
+
+    def record(self):
+        # Whole project record, as saved by get_project_data_file()
+        d = self.extra
+        d.update({'project_id': self.id, 'project_title': self.title, 'start': self.start, 'end': self.end,
+                  'outputs': unpack(self._outputs) or [], 'document_name': unpack(self._documents) or [[], [], []]})
+        return d
+
+    def nbytes(self):
+        # Bytes held in packed fields
+        return sum(len(b) for b in (self._outputs, self._documents, self._extra) if b is not None)
+
+    def __repr__(self):
+        return "Project(%r, %r, %r)" % (self.ou, self.id, self.title)
+
+
+class Portfolio:
+    """
+    All projects of a snapshot, indexed by operating unit and id
+    """
+    def __init__(self, projects=()):
+        self.projects = []
+        self._index = {}
+        self._by_ou = {}
+        for p in projects:
+            self.add(p)
+
+    def add(self, project):
+        self.projects.append(project)
+        self._index[(project.ou, project.id)] = project
+        self._by_ou.setdefault(project.ou, []).append(project)
+
+    @classmethod
+    def from_store(cls, store=None, units=None, compress=False, verbose=False):
+        """
+        Load projects of operating units from store (devdata.store), shared store if None
+          units--list of operating unit ids, all units of operating unit index if None
+          compress--keep packed fields zlib compressed, about 5 times smaller but slower to access
+        Records are read one at a time, so memory use is that of the compact model
+        """
+        store = store if store is not None else get_store()
+        if units is None:
+            units = [ou['id'] for ou in store.load('index', '', 'operating-unit-index') or []]
+        portfolio = cls()
+        for ou in units:
+            unit = store.load('unit', ou, ou)
+            if unit is None:
+                if verbose:
+                    print(f"  No projects of {ou} in store")
+                continue
+            for p in unit.get('projects', []):
+                record = store.load('project', ou, p['id'])
+                if record is not None:
+                    portfolio.add(Project(ou, record, compress))
+        if verbose:
+            print(f"{len(portfolio)} projects of {len(portfolio.units())} operating units, "
+                  f"{portfolio.nbytes() / 2**20:.1f} MB packed")
+        return portfolio
+
+    def get(self, ou, project_id):
+        return self._index.get((ou, project_id))
+
+    def by_ou(self, ou):
+        return self._by_ou.get(ou, [])
+
+    def units(self):
+        return list(self._by_ou)
+
+    def column(self, name):
+        # Values of slot name of all projects, array of floats for budget and expenditure
+        if name in ('budget', 'expenditure'):
+            return array('d', [getattr(p, name) for p in self.projects])
+        return [getattr(p, name) for p in self.projects]
+
+    def nbytes(self):
+        return sum(p.nbytes() for p in self.projects)
+
+    def __iter__(self):
+        return iter(self.projects)
+
+    def __len__(self):
+        return len(self.projects)
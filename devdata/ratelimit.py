@@ -0,0 +1,139 @@
+"""
+Adaptive per-host rate limits: a token bucket per host whose rate follows AIMD, additive
+increase while responses are healthy and multiplicative decrease on 429, 5xx, connection
+errors or p95 latency growing well above the best seen. HttpClient takes a token before
+every attempt and reports its outcome, so every pipeline runs near the highest rate the
+API tolerates. 429 with Retry-After also pauses the whole host, not only the throttled request.
+
+    set_client(HttpClient(rate_limiter=AdaptiveRateLimiter(rates={"api.open.undp.org": 20})))
+"""
+import threading
+import time
+from collections import deque
+
+from devdata.crawl import url_host
+from devdata.telemetry import get_telemetry
+
+# Statuses which mean server is overloaded
+BACKOFF_STATUS = (429, 500, 502, 503, 504)
+
+
+class HostRate:
+    # Token bucket of one host, see AdaptiveRateLimiter
+    def __init__(self, rate, burst, window):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.last_cut = 0.0
+        self.latencies = deque(maxlen=window)
+        self.best_p95 = None
+        self.lock = threading.Lock()
+
+    def p95(self):
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+class AdaptiveRateLimiter:
+    """
+    Per-host requests per second, adjusted from responses.
+      rate--initial rate for hosts not in rates
+      rates--{host: initial rate}, e.g. {"api.open.undp.org": 20}
+      min_rate, max_rate--bounds of rate
+      increase--rate added per second of healthy responses
+      decrease--rate is multiplied by it on overload, at most once per cooldown seconds
+      burst--tokens a host can save up, requests sent at once after idle time
+      window--number of latest latencies p95 is taken from
+      latency_factor--overload if p95 is above latency_factor times best p95 seen
+    """
+    def __init__(self, rate=5.0, rates=None, min_rate=0.2, max_rate=200.0, increase=1.0, decrease=0.5,
+                 burst=4, window=50, latency_factor=3.0, cooldown=2.0):
+        self.rate = rate
+        self.rates = {h.lower(): r for h, r in (rates or {}).items()}
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.window = window
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def host(self, url):
+        name = url_host(url)
+        with self._lock:
+            h = self._hosts.get(name)
+            if h is None:
+                h = self._hosts[name] = HostRate(self.rates.get(name, self.rate), self.burst, self.window)
+        return h
+
+    def acquire(self, url):
+        # Wait for a token of url's host
+        h = self.host(url)
+        while True:
+            with h.lock:
+                now = time.monotonic()
+                h.tokens = min(h.burst, h.tokens + (now - h.updated) * h.rate)
+                h.updated = now
+                if now >= h.paused_until and h.tokens >= 1:
+                    h.tokens -= 1
+                    return
+                wait = max(h.paused_until - now, (1 - h.tokens) / h.rate)
+            time.sleep(wait)
+
+    def feedback(self, url, status, seconds, retry_after=None):
+        """
+        Report outcome of request to url: status code or "error", seconds it took,
+        Retry-After in seconds if server sent it
+        """
+        h = self.host(url)
+        with h.lock:
+            now = time.monotonic()
+            overload = status == "error" or status in BACKOFF_STATUS
+            if not overload:
+                h.latencies.append(seconds)
+                if len(h.latencies) == h.latencies.maxlen:
+                    p95 = h.p95()
+                    h.best_p95 = p95 if h.best_p95 is None else min(h.best_p95, p95)
+                    overload = p95 > self.latency_factor * h.best_p95
+            if retry_after:
+                h.paused_until = max(h.paused_until, now + retry_after)
+            if overload:
+                if now - h.last_cut >= self.cooldown:
+                    h.rate = max(self.min_rate, h.rate * self.decrease)
+                    h.last_cut = now
+                    # Latencies of the old rate would cut it again
+                    h.latencies.clear()
+            else:
+                h.rate = min(self.max_rate, h.rate + self.increase / h.rate)
+            rate = h.rate
+        get_telemetry().gauge("rate " + url_host(url), round(rate, 3))
+
+    def rates_now(self):
+        # {host: current rate}
+        with self._lock:
+            return {name: h.rate for name, h in self._hosts.items()}
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    # Shared rate limiter, created with defaults on first use
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = AdaptiveRateLimiter()
+        return _rate_limiter
+
+
+def set_rate_limiter(limiter):
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = limiter
+    return limiter
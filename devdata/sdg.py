@@ -0,0 +1,319 @@
+"""
+Functions for UNSD SDG API, https://unstats.un.org/SDGAPI/swagger/
+
+Bulk loading: instead of one /Series/{code}/GeoArea/{m49}/DataSlice request per series
+per country, plan_queries() groups series and countries into multi-series, multi-area
+/Series/Data queries, which are read page by page with large page size.
+
+Parallel loading: load_series_parallel() loads series with DataSlice requests on a pool
+of workers; one writer thread appends whole series to UNSTAT-ALL-DATA.tsv.
+
+Dimensions of series only change with releases, DimensionCache keeps them in memory
+and on disk keyed by series code and release.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+
+import requests
+
+from devdata.client import get_client, try_get
+from devdata.crawl import Crawler
+from devdata.sinks import TextAppender
+from devdata.telemetry import ProgressLine
+
+SDG_API = "https://unstats.un.org/SDGAPI/v1/sdg"
+PAGE_SIZE = 50000
+
+
+class DimensionCache:
+    """
+    Cache of /Series/{code}/Dimensions responses: in-process memo plus json files
+    {directory}/{release}/{code}.json. Release comes from Series/List, e.g. "2020.Q2.G.01",
+    so a new release invalidates cached dimensions of its series.
+      directory--folder for cache, None to keep it in memory only
+    """
+    def __init__(self, directory=None):
+        self.directory = os.path.abspath(directory) if directory else None
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _release_dir(release):
+        return re.sub(r'[^\w.-]', '_', release or 'unknown')
+
+    def _path(self, series_code, release):
+        return os.path.join(self.directory, self._release_dir(release), series_code + ".json")
+
+    def get(self, series_code, release=""):
+        """
+        Return dimensions of series as returned by API, list of {'id': ..., 'codes': [...]}
+        Raise RuntimeError if dimensions are not cached and cannot be got
+        """
+        key = (series_code, release)
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+        dims = None
+        if self.directory is not None and os.path.isfile(self._path(series_code, release)):
+            with open(self._path(series_code, release), 'r', encoding='utf-8') as f:
+                dims = json.load(f)
+        if dims is None:
+            try:
+                r = get_client().get(f"{SDG_API}/Series/{series_code}/Dimensions")
+            except requests.exceptions.RequestException as err:
+                raise RuntimeError("Cannot get dimensions of %s: %s" % (series_code, err))
+            if r.status_code != 200:
+                raise RuntimeError("Cannot get dimensions of %s: status %d" % (series_code, r.status_code))
+            dims = r.json()
+            if self.directory is not None:
+                fname = self._path(series_code, release)
+                os.makedirs(os.path.dirname(fname), exist_ok=True)
+                with open(fname + '.tmp', 'w', encoding='utf-8') as f:
+                    json.dump(dims, f, ensure_ascii=False)
+                os.replace(fname + '.tmp', fname)
+        with self._lock:
+            self._memo[key] = dims
+        return dims
+
+    def purge(self, releases):
+        # Remove cached releases not in list releases, nothing if list is empty, e.g. Series/List failed
+        if not releases or self.directory is None or not os.path.isdir(self.directory):
+            return
+        keep = {self._release_dir(r) for r in releases}
+        for name in os.listdir(self.directory):
+            if name not in keep:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+_dimension_cache = None
+_dimension_cache_lock = threading.Lock()
+
+
+def get_dimension_cache():
+    # Shared dimension cache, in memory only if not set
+    global _dimension_cache
+    with _dimension_cache_lock:
+        if _dimension_cache is None:
+            _dimension_cache = DimensionCache()
+        return _dimension_cache
+
+
+def set_dimension_cache(cache):
+    global _dimension_cache
+    with _dimension_cache_lock:
+        _dimension_cache = cache
+    return cache
+
+
+def series_unique(series_code, d, code_inc_dims):
+    # Series code with values of dimensions in code_inc_dims, e.g. EG_ELC_ACCS_URBAN
+    series_unique = series_code
+    for cid in code_inc_dims:
+        if cid in d.keys():
+            series_unique = series_unique + "_" + d[cid].strip()
+        else:
+            print("! Warning, %s doesn't has dimension %s" % (series_code, cid))
+    return series_unique
+
+
+def series_row(c_ISO, series_code, d, code_inc_dims, data_fields):
+    """
+    Format data record d as tab separated line:
+    ISO3, series code with dimensions in code_inc_dims, year, value, list of (dimension, value)
+    d is flat dictionary of dimensions, 'timePeriodStart' and 'value', as in DataSlice
+    """
+    return "{}\t{}\t{}\t{}\t{}\n".format(c_ISO,
+                                         series_unique(series_code, d, code_inc_dims),
+                                         d['timePeriodStart'],
+                                         d['value'], [(k, d[k]) for k in d.keys() if k not in data_fields])
+
+
+def plan_queries(series_codes, countries, series_per_query=20, areas_per_query=100):
+    """
+    Group series and countries into bulk queries
+    Return list of (list of series codes, list of M49 codes)
+    """
+    queries = []
+    for i in range(0, len(series_codes), series_per_query):
+        for j in range(0, len(countries), areas_per_query):
+            queries.append((series_codes[i:i+series_per_query], countries[j:j+areas_per_query]))
+    return queries
+
+
+def data_record(rec):
+    """
+    Convert record of /Series/Data to flat dictionary as in DataSlice:
+    dimensions, 'timePeriodStart' and 'value'
+    """
+    d = dict(rec.get('dimensions') or {})
+    d['timePeriodStart'] = rec['timePeriodStart']
+    d['value'] = rec['value']
+    return d
+
+
+def iter_query(series_codes, countries, page_size=PAGE_SIZE, verbose=False):
+    """
+    Yield records of /Series/Data for series and countries, following all pages
+    Raise RuntimeError if a page cannot be got, so that partial result is not taken as complete
+    """
+    params = [('seriesCode', s) for s in series_codes] + [('areaCode', str(c)) for c in countries]
+    page = 1
+    while True:
+        try:
+            r = get_client().get(f"{SDG_API}/Series/Data", params=params + [('pageSize', page_size), ('page', page)])
+        except requests.exceptions.RequestException as err:
+            raise RuntimeError("Cannot get page %d of %s: %s" % (page, ",".join(series_codes), err))
+        if r.status_code != 200:
+            raise RuntimeError("Cannot get page %d of %s: status %d" % (page, ",".join(series_codes), r.status_code))
+        data = r.json()
+        if verbose:
+            print("  Page %d of %s, %d records" % (page, data.get('totalPages'), len(data.get('data', []))))
+        yield from data.get('data', [])
+        if not data.get('data') or page >= (data.get('totalPages') or 0):
+            return
+        page += 1
+
+
+def load_series_bulk(series_codes, countries, M49_ISO, data_fields, dim_aggrs, data_dir="Data", columnar=None,
+                     verbose=False):
+    """
+    Load series for list of countries with bulk queries into {data_dir}/{series}.tsv and
+    append rows to {data_dir}/UNSTAT-ALL-DATA.tsv. Series with existing .tsv are skipped.
+    Rows of a query go to .part files first: series .tsv appears only when all its
+    queries succeeded, and rows of failed query are not appended to UNSTAT-ALL-DATA.tsv
+    columnar--SdgParquetWriter, complete series are also written to Parquet store
+    Return (number of queries, number of rows)
+    """
+    todo = [s for s in series_codes if not os.path.isfile(os.path.join(data_dir, s + ".tsv"))]
+    queries = plan_queries(todo, countries)
+    # Groups of countries for every series, series is complete after its last group
+    by_series = {}
+    for q_series, q_countries in queries:
+        for s in q_series:
+            by_series.setdefault(s, []).append(q_countries)
+    failed = set()
+    n_rows = 0
+    big_part = os.path.join(data_dir, "UNSTAT-ALL-DATA.tsv.part")
+    for n, (q_series, q_countries) in enumerate(queries):
+        print("Query %d of %d: %s, %d countries" % (n+1, len(queries), ", ".join(q_series), len(q_countries)))
+        parts = {s: os.path.join(data_dir, s + ".tsv.part") for s in q_series}
+        files = {s: open(parts[s], "w" if by_series[s][0] is q_countries else "a") for s in q_series}
+        ok = True
+        q_rows = 0
+        try:
+            with open(big_part, "w") as f_big:
+                for rec in iter_query(q_series, q_countries, verbose=verbose):
+                    s = rec['series']
+                    if s not in files:
+                        continue
+                    c_ISO = M49_ISO.get(int(rec['geoAreaCode']))
+                    d = data_record(rec)
+                    write_str = series_row(c_ISO, s, d, dim_aggrs.get(s, []), data_fields)
+                    if columnar is not None:
+                        columnar.add(c_ISO, s, series_unique(s, d, dim_aggrs.get(s, [])), d)
+                    files[s].write(write_str)
+                    f_big.write(write_str)
+                    q_rows += 1
+        except RuntimeError as err:
+            print("Something went wrong: %s" % err)
+            ok = False
+            failed.update(q_series)
+        finally:
+            for f in files.values():
+                f.close()
+        if ok:
+            with open(big_part, "r") as f_part, open(os.path.join(data_dir, "UNSTAT-ALL-DATA.tsv"), "a") as f_all:
+                shutil.copyfileobj(f_part, f_all)
+            n_rows += q_rows
+        os.remove(big_part)
+        for s in q_series:
+            if by_series[s][-1] is q_countries:
+                if s in failed:
+                    os.remove(parts[s])
+                    if columnar is not None:
+                        columnar.discard(s)
+                else:
+                    os.replace(parts[s], os.path.join(data_dir, s + ".tsv"))
+                    if columnar is not None:
+                        columnar.finish(s)
+    return len(queries), n_rows
+
+
+def load_series_slices(series_code, countries, M49_ISO, data_fields, code_inc_dims=(), data_dir="Data",
+                       big=None, columnar=None):
+    """
+    Load series for list of countries with one DataSlice request per country into
+    {data_dir}/{series_code}.tsv. Series with existing .tsv is skipped.
+    Rows go to .tsv.part first, so an interrupted run doesn't leave a series which looks complete.
+    Series is written only if requests of all countries succeeded, as in load_series_bulk()
+      big--TextAppender of UNSTAT-ALL-DATA.tsv, gets all rows of series as one chunk
+      columnar--SdgParquetWriter, series is also written to Parquet store
+    Return number of rows, None if series was skipped; raise RuntimeError if a request failed
+    """
+    fname = os.path.join(data_dir, series_code + ".tsv")
+    if os.path.isfile(fname):
+        return None
+    rows = []
+    failed = []
+    for c in countries:
+        try_rec = try_get(f"{SDG_API}/Series/{series_code}/GeoArea/{c}/DataSlice")
+        if try_rec['code'] == "Ok":
+            data = try_rec['result'].json()
+            c_ISO = M49_ISO.get(c)
+            for d in data['dimensions']:
+                rows.append(series_row(c_ISO, series_code, d, code_inc_dims, data_fields))
+                if columnar is not None:
+                    columnar.add(c_ISO, series_code, series_unique(series_code, d, code_inc_dims), d)
+        else:
+            print("Something went wrong getting %s for %s: %s" % (series_code, M49_ISO.get(c), try_rec['result']))
+            failed.append(M49_ISO.get(c, c))
+    if failed:
+        # Nothing of series is written, it is loaded again on next run
+        if columnar is not None:
+            columnar.discard(series_code)
+        raise RuntimeError("%s not loaded, requests failed for %s" % (series_code, ", ".join(map(str, failed))))
+    with open(fname + ".part", "w") as f:
+        f.writelines(rows)
+    os.replace(fname + ".part", fname)
+    if big is not None:
+        big.put("".join(rows))
+    if columnar is not None:
+        columnar.finish(series_code)
+    return len(rows)
+
+
+def load_series_parallel(series_codes, countries, M49_ISO, data_fields, dim_aggrs, data_dir="Data", workers=8,
+                         columnar=None, verbose=False):
+    """
+    Load series with load_series_slices() on workers threads, series with existing .tsv are skipped.
+    Only one thread writes {data_dir}/UNSTAT-ALL-DATA.tsv, so rows of series never interleave.
+    Series with failed requests are reported and not written
+    Return (number of series loaded, number of rows)
+    """
+    done = []
+    lock = threading.Lock()
+    progress = ProgressLine(len(series_codes), "series")
+
+    def task(s):
+        try:
+            n = load_series_slices(s, countries, M49_ISO, data_fields, dim_aggrs.get(s, []), data_dir, big, columnar)
+        finally:
+            progress.update()
+        if n is not None:
+            with lock:
+                done.append(n)
+            if verbose:
+                print("Loaded %s, %d rows" % (s, n))
+
+    crawler = Crawler(workers=workers, verbose=verbose)
+    with TextAppender(os.path.join(data_dir, "UNSTAT-ALL-DATA.tsv")) as big:
+        for s in series_codes:
+            crawler.submit(task, s)
+        errors = crawler.join()
+    progress.close()
+    for err in errors:
+        print("Something went wrong: %r" % err)
+    return len(done), sum(done)
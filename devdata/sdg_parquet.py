@@ -0,0 +1,141 @@
+"""
+Typed columnar store for SDG data, alongside UNSTAT-ALL-DATA.tsv. Requires pyarrow.
+
+Data are partitioned by goal and series, {root}/goal={goal}/series_code={code}/part-0.parquet,
+with columns
+  iso3--country ISO3 code
+  series--series code with dimensions from dim_aggrs, as in .tsv, e.g. SL_TLF_UEM_15+_FEMALE
+  year--int
+  value--float, null if value is not numeric
+  value_text--value as published
+  one column per dimension, e.g. Sex, Age, Location
+String columns are dictionary-encoded. Read one goal or slice with predicate pushdown:
+
+    t = read_sdg("Data/parquet", goal="1", filter=pyarrow.dataset.field("Sex") == "FEMALE")
+"""
+import os
+import threading
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Columns which are not dimensions
+BASE_COLUMNS = ('iso3', 'series', 'year', 'value', 'value_text')
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("SDG Parquet store requires pyarrow, install it or use .tsv files")
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_year(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class SdgParquetWriter:
+    """
+    Collect rows of series and write each series as one partition when it is complete.
+      root--folder of the store
+      goals--dictionary {series code: goal}, series of several goals go under the first one
+      data_fields--fields of data record which are not dimensions, see main script
+    """
+    def __init__(self, root, goals, data_fields=('value', 'timePeriodStart', 'Reporting Type')):
+        _require_pyarrow()
+        self.root = root
+        self.goals = goals
+        self.data_fields = data_fields
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def add(self, c_ISO, series_code, series_unique, d):
+        """
+        Add data record d (flat dictionary as in DataSlice) of series_code for country c_ISO
+        """
+        row = {'iso3': c_ISO, 'series': series_unique,
+               'year': to_year(d['timePeriodStart']),
+               'value': to_float(d['value']), 'value_text': None if d['value'] is None else str(d['value'])}
+        for k in d.keys():
+            if k not in self.data_fields and k not in BASE_COLUMNS:
+                row[k] = None if d[k] is None else str(d[k]).strip()
+        with self._lock:
+            self._rows.setdefault(series_code, []).append(row)
+
+    def partition(self, series_code):
+        return os.path.join(self.root, "goal=%s" % self.goals.get(series_code, 'unknown'),
+                            "series_code=%s" % series_code)
+
+    def finish(self, series_code):
+        """
+        Write collected rows of series_code, replacing earlier partition of the series
+        """
+        with self._lock:
+            rows = self._rows.pop(series_code, [])
+        dims = []
+        for row in rows:
+            for k in row:
+                if k not in BASE_COLUMNS and k not in dims:
+                    dims.append(k)
+        columns = {
+            'iso3': pa.array([r['iso3'] for r in rows], pa.string()).dictionary_encode(),
+            'series': pa.array([r['series'] for r in rows], pa.string()).dictionary_encode(),
+            'year': pa.array([r['year'] for r in rows], pa.int16()),
+            'value': pa.array([r['value'] for r in rows], pa.float64()),
+            'value_text': pa.array([r['value_text'] for r in rows], pa.string()),
+        }
+        for k in dims:
+            columns[k] = pa.array([r.get(k) for r in rows], pa.string()).dictionary_encode()
+        table = pa.table(columns)
+        folder = self.partition(series_code)
+        os.makedirs(folder, exist_ok=True)
+        fname = os.path.join(folder, "part-0.parquet")
+        pq.write_table(table, fname + ".tmp", compression='zstd')
+        os.replace(fname + ".tmp", fname)
+        return len(rows)
+
+    def discard(self, series_code):
+        # Drop collected rows of series which failed to load
+        with self._lock:
+            self._rows.pop(series_code, None)
+
+
+def open_sdg(root):
+    """
+    Open store as pyarrow dataset, with schema unified over all series, as series
+    have different dimensions
+    """
+    _require_pyarrow()
+    files = [os.path.join(d, f) for d, _, fs in os.walk(root) for f in fs if f.endswith('.parquet')]
+    partitioning = ds.partitioning(pa.schema([('goal', pa.string()), ('series_code', pa.string())]), flavor='hive')
+    schema = pa.unify_schemas([pq.read_schema(f) for f in files] +
+                              [pa.schema([('goal', pa.string()), ('series_code', pa.string())])])
+    return ds.dataset(files, schema=schema, format='parquet', partitioning=partitioning,
+                      partition_base_dir=root)
+
+
+def read_sdg(root, goal=None, series_code=None, filter=None, columns=None):
+    """
+    Read store into pyarrow Table, only partitions of goal and series_code if given
+    filter--pyarrow.dataset expression, e.g. ds.field('iso3') == 'KAZ'
+    columns--list of columns to read, all if None
+    """
+    dataset = open_sdg(root)
+    expr = filter
+    for name, val in (('goal', goal), ('series_code', series_code)):
+        if val is not None:
+            e = ds.field(name) == str(val)
+            expr = e if expr is None else expr & e
+    return dataset.to_table(columns=columns, filter=expr)
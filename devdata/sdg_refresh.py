@@ -0,0 +1,222 @@
+"""
+Long-running refresh of SDG data which follows the release calendar of the UNSD SDG API.
+
+SdgRefresher polls /Series/List and compares release of every series with the release
+seen before, kept in a json state file. Series with a new release are re-read with bulk
+/Series/Data queries, one series at a time; rows of every country are fingerprinted and
+compared with rows already in {data_dir}/{series}.tsv, and only countries whose rows changed
+are replaced in {series}.tsv and UNSTAT-ALL-DATA.tsv, which is rewritten once per refresh.
+Series of unchanged releases are not requested at all. The API has no per-country fingerprint,
+so a new release tag means a full refetch of the series: at quarterly releases, when tags of
+all series change, every series is read again, though files are still rewritten only for
+countries whose rows changed.
+Dimension cache and HTTP client stay warm in the process between polls.
+
+    refresher = SdgRefresher(countries, M49_ISO, data_fields, dim_aggrs, goals=["1", "17"])
+    refresher.run()                 # poll forever
+    refresher.refresh()             # or one poll, e.g. from cron
+"""
+import datetime
+import hashlib
+import json
+import os
+import time
+
+from devdata.client import get_client
+from devdata.sdg import SDG_API, data_record, get_dimension_cache, iter_query, plan_queries, series_row, series_unique
+from devdata.telemetry import get_telemetry
+
+# Months in which UNSD usually publishes releases of the global SDG database, polled more often
+RELEASE_MONTHS = (3, 4, 6, 7, 9, 12)
+
+
+def fingerprint(rows):
+    # Hash of rows of one series and country, independent of row order
+    h = hashlib.sha256()
+    for row in sorted(rows):
+        h.update(row.encode('utf-8'))
+    return h.hexdigest()
+
+
+def read_series_rows(fname):
+    """
+    Read rows of series .tsv grouped by country
+    Return {ISO3: [row, ...]}, empty if file doesn't exist
+    """
+    by_country = {}
+    if os.path.isfile(fname):
+        with open(fname, "r") as f:
+            for row in f:
+                by_country.setdefault(row.split('\t', 1)[0], []).append(row)
+    return by_country
+
+
+def replace_rows(fname, drop, rows, dest=None):
+    """
+    Write fname without lines whose (ISO3, series) is in drop, and with rows (iterable of lines, e.g.
+    open file) appended, to dest (fname if None). File is written to .part first and replaced at once,
+    so readers never see it half written
+    """
+    dest = dest or fname
+    with open(dest + ".part", "w") as f_out:
+        if os.path.isfile(fname):
+            with open(fname, "r") as f_in:
+                for line in f_in:
+                    key = tuple(line.split('\t', 2)[:2])
+                    if key not in drop:
+                        f_out.write(line)
+        f_out.writelines(rows)
+    os.replace(dest + ".part", dest)
+
+
+class SdgRefresher:
+    """
+    Incremental refresh of SDG series in data_dir, see module description
+      countries, M49_ISO, data_fields, dim_aggrs--as for load_series_bulk()
+      goals--goals to keep refreshed, all goals if empty
+      state_file--json file with release of every series as of the last refresh
+      columnar--SdgParquetWriter, partitions of changed series are rewritten
+      interval--seconds between polls, release_interval--seconds between polls in RELEASE_MONTHS
+    """
+    def __init__(self, countries, M49_ISO, data_fields, dim_aggrs, goals=(), data_dir="Data",
+                 state_file=None, columnar=None, interval=24*3600, release_interval=3600, verbose=False):
+        self.countries = countries
+        self.M49_ISO = M49_ISO
+        self.data_fields = data_fields
+        self.dim_aggrs = dim_aggrs
+        self.goals = set(goals)
+        self.data_dir = data_dir
+        self.state_file = state_file or os.path.join(data_dir, "refresh-state.json")
+        self.columnar = columnar
+        self.interval = interval
+        self.release_interval = release_interval
+        self.verbose = verbose
+        self.state = {'releases': {}}
+        if os.path.isfile(self.state_file):
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def save_state(self):
+        with open(self.state_file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(self.state_file + ".tmp", self.state_file)
+
+    def series_list(self):
+        # Series/List of the latest release, only series of goals
+        r = get_client().get(f"{SDG_API}/Series/List", params={'allreleases': 'false'})
+        if r.status_code != 200:
+            raise RuntimeError("Cannot get Series/List: status %d" % r.status_code)
+        return [s for s in r.json() if not self.goals or self.goals.intersection(s.get('goal', []))]
+
+    def changed_series(self, series):
+        # Series whose release differs from state, or which have no .tsv yet
+        releases = self.state['releases']
+        return [s['code'] for s in series
+                if releases.get(s['code']) != s.get('release', '') or
+                not os.path.isfile(os.path.join(self.data_dir, s['code'] + ".tsv"))]
+
+    def fetch(self, series_code):
+        """
+        Read one series with bulk queries, so only one series is held in memory
+        Return ({ISO3: [row, ...]}, [(ISO3, record), ...]), records are for columnar store
+        """
+        rows = {}
+        records = []
+        for q_series, q_countries in plan_queries([series_code], self.countries):
+            for rec in iter_query(q_series, q_countries, verbose=self.verbose):
+                if rec['series'] != series_code:
+                    continue
+                c_ISO = self.M49_ISO.get(int(rec['geoAreaCode']))
+                d = data_record(rec)
+                rows.setdefault(c_ISO, []).append(series_row(c_ISO, series_code, d,
+                                                             self.dim_aggrs.get(series_code, []), self.data_fields))
+                if self.columnar is not None:
+                    records.append((c_ISO, d))
+        return rows, records
+
+    def update_series(self, series_code, new_rows, records, drop, f_new):
+        """
+        Write {series}.tsv.new with rows of countries which changed replaced, add their (ISO3, series)
+        keys to drop and their new rows to f_new, for UNSTAT-ALL-DATA.tsv
+        Return number of countries changed, None if {series}.tsv is up to date
+        """
+        fname = os.path.join(self.data_dir, series_code + ".tsv")
+        old_rows = read_series_rows(fname)
+        changed = [c for c in set(old_rows) | set(new_rows)
+                   if fingerprint(old_rows.get(c, [])) != fingerprint(new_rows.get(c, []))]
+        if not changed and os.path.isfile(fname):
+            return None
+        # Rows are keyed by (ISO3, series code with dimensions), take labels of old and new rows
+        drop_series = {tuple(row.split('\t', 2)[:2]) for c in changed for row in old_rows.get(c, [])}
+        rows = [row for c in changed for row in new_rows.get(c, [])]
+        replace_rows(fname, drop_series, rows, dest=fname + ".new")
+        drop.update(drop_series)
+        f_new.writelines(rows)
+        if self.columnar is not None:
+            for c_ISO, d in records:
+                self.columnar.add(c_ISO, series_code, series_unique(series_code, d, self.dim_aggrs.get(series_code, [])),
+                                  d)
+            self.columnar.finish(series_code)
+        return len(changed)
+
+    def refresh(self):
+        """
+        Poll Series/List once and refresh series of new releases, one series at a time.
+        Changed rows of all series are collected in UNSTAT-ALL-DATA.tsv.new-rows and UNSTAT-ALL-DATA.tsv
+        is rewritten once; {series}.tsv files are replaced after it, so an interrupted refresh is redone
+        Return {series: number of countries changed}
+        """
+        series = self.series_list()
+        releases = {s['code']: s.get('release', '') for s in series}
+        # New releases invalidate cached dimensions, which are then got again on first use
+        get_dimension_cache().purge(set(releases.values()))
+        todo = self.changed_series(series)
+        if not todo:
+            return {}
+        os.makedirs(self.data_dir, exist_ok=True)
+        big = os.path.join(self.data_dir, "UNSTAT-ALL-DATA.tsv")
+        result = {}
+        drop = set()
+        with open(big + ".new-rows", "w") as f_new:
+            for s in todo:
+                rows, records = self.fetch(s)
+                result[s] = self.update_series(s, rows, records, drop, f_new)
+        if any(n is not None for n in result.values()):
+            with open(big + ".new-rows", "r") as f_new:
+                replace_rows(big, drop, f_new)
+        os.remove(big + ".new-rows")
+        for s in todo:
+            if result[s] is not None:
+                fname = os.path.join(self.data_dir, s + ".tsv")
+                os.replace(fname + ".new", fname)
+            result[s] = result[s] or 0
+            self.state['releases'][s] = releases[s]
+            if self.verbose:
+                print("Refreshed %s, %d countries changed" % (s, result[s]))
+        self.state['checked'] = datetime.datetime.now().isoformat(timespec='seconds')
+        self.save_state()
+        get_telemetry().gauge("sdg_series_refreshed", len(todo))
+        get_telemetry().gauge("sdg_countries_changed", sum(result.values()))
+        return result
+
+    def next_poll(self, now=None):
+        # Seconds until next poll, shorter in release months
+        month = (now or datetime.datetime.now()).month
+        return self.release_interval if month in RELEASE_MONTHS else self.interval
+
+    def run(self, polls=None):
+        """
+        Refresh, then sleep until next poll, polls times or forever if None.
+        A failed poll is reported and retried at the next one, partial updates are never written
+        """
+        n = 0
+        while polls is None or n < polls:
+            try:
+                result = self.refresh()
+                print("%s: %d series refreshed, %d countries changed" % (
+                    datetime.datetime.now().isoformat(timespec='seconds'), len(result), sum(result.values())))
+            except RuntimeError as err:
+                print("Something went wrong: %s" % err)
+            n += 1
+            if polls is None or n < polls:
+                time.sleep(self.next_poll())
@@ -0,0 +1,180 @@
+"""
+Append-only record writers, so harvested records go to disk as they are fetched
+instead of piling up in memory.
+NdjsonWriter appends one json record per line. ParquetWriter writes every batch as a
+Parquet part file {folder}/part-{n}.parquet, requires pyarrow.
+Both write in batches, crash loses at most the current batch.
+TextAppender is a single writer thread appending text chunks to a file shared by
+many worker threads, so chunks never interleave.
+
+    with NdjsonWriter("big-results-file.ndjson", batch=100) as out:
+        out.write(r_data)
+"""
+import json
+import os
+import queue
+import threading
+
+from devdata.telemetry import get_telemetry
+
+
+class NdjsonWriter:
+    """
+    Append records to NDJSON file.
+      path--file name, records are appended to existing file
+      batch--number of records kept in memory before they are written and flushed
+      fsync--sync file to disk after every batch
+    """
+    def __init__(self, path, batch=100, fsync=False):
+        self.path = path
+        self.batch = batch
+        self.fsync = fsync
+        self.count = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._f = open(path, 'a', encoding='utf-8')
+
+    def write(self, record):
+        with self._lock:
+            self._buffer.append(json.dumps(record, ensure_ascii=False))
+            self.count += 1
+            if len(self._buffer) >= self.batch:
+                self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            text = '\n'.join(self._buffer) + '\n'
+            self._f.write(text)
+            get_telemetry().write('ndjson', len(self._buffer), len(text.encode('utf-8')))
+            self._buffer = []
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetWriter:
+    """
+    Write records as Parquet part files, one file per batch, to folder.
+      folder--created if it doesn't exist, new parts are numbered after existing ones
+      batch--number of records per part file
+    Read all parts at once with pyarrow.dataset or pandas.read_parquet(folder).
+    """
+    def __init__(self, folder, batch=10000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("ParquetWriter requires pyarrow, install it or use NdjsonWriter")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.folder = folder
+        self.batch = batch
+        self.count = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        parts = [int(f[5:-8]) for f in os.listdir(folder)
+                 if f.startswith('part-') and f.endswith('.parquet') and f[5:-8].isdigit()]
+        self._part = max(parts) + 1 if parts else 0
+
+    def write(self, record):
+        with self._lock:
+            self._buffer.append(record)
+            self.count += 1
+            if len(self._buffer) >= self.batch:
+                self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        table = self._pa.Table.from_pylist(self._buffer)
+        fname = os.path.join(self.folder, "part-%05d.parquet" % self._part)
+        # Write to temporary name, so that a crash never leaves a broken part
+        self._pq.write_table(table, fname + '.tmp', compression='zstd')
+        os.replace(fname + '.tmp', fname)
+        get_telemetry().write('parquet', len(self._buffer), os.path.getsize(fname))
+        self._part += 1
+        self._buffer = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TextAppender:
+    """
+    Append text chunks to file from a dedicated thread. Workers put() whole chunks,
+    e.g. all rows of a series, chunks are written in the order they come, one at a time.
+      path--file name, chunks are appended to existing file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._queue = queue.Queue()
+        self._f = open(path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._run, name="TextAppender", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                break
+            self._f.write(chunk)
+            self._f.flush()
+            self.count += 1
+            get_telemetry().write('append', chunk.count('\n'), len(chunk.encode('utf-8')))
+            get_telemetry().gauge('append_queue', self._queue.qsize())
+        self._f.close()
+
+    def put(self, chunk):
+        if chunk:
+            self._queue.put(chunk)
+            get_telemetry().gauge('append_queue', self._queue.qsize())
+
+    def close(self):
+        # Write chunks put so far and close file
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_writer(name, format="ndjson", batch=None):
+    """
+    Open writer for records: "ndjson" writes {name}.ndjson, "parquet" writes
+    part files to folder {name}
+    """
+    if format == "ndjson":
+        return NdjsonWriter(name + ".ndjson", batch=batch or 100)
+    if format == "parquet":
+        return ParquetWriter(name, batch=batch or 10000)
+    raise ValueError("Unknown format %s, use ndjson or parquet" % format)
@@ -0,0 +1,165 @@
+"""
+Storage of snapshot records: operating unit index, units, projects and project results.
+FileStore keeps today's layout, one indented json file per record.
+SnapshotStore packs records into one SQLite file keyed by (snapshot date, kind, ou, id);
+records are stored once as compressed compact json, so identical records are shared
+by all snapshot dates.
+
+    set_store(SnapshotStore("UNDP Snapshots.sqlite", "2020-12-03"))
+    get_store().save('project', 'PAL', '00057409', p_data)
+    p_data = get_store().load('project', 'PAL', '00057409')
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+# Kinds of records
+KINDS = ('index', 'unit', 'project', 'results', 'bulk')
+
+
+class FileStore:
+    """
+    One json file per record under root:
+      index--{id}.json, e.g. operating-unit-index.json
+      unit--{ou}/{ou}.json
+      project--{ou}/{id}.json
+      results--{ou}/results {id}.json
+      bulk--{ou}/bulk {id}.json, flat project row of bulk source, see devdata.undp_bulk
+    """
+    def __init__(self, root='.'):
+        self.root = root
+
+    def path(self, kind, ou, id):
+        if kind == 'index':
+            return os.path.join(self.root, f"{id}.json")
+        if kind in ('results', 'bulk'):
+            return os.path.join(self.root, ou, f"{kind} {id}.json")
+        return os.path.join(self.root, ou, f"{id}.json")
+
+    def save(self, kind, ou, id, data):
+        fname = self.path(kind, ou, id)
+        os.makedirs(os.path.dirname(fname) or '.', exist_ok=True)
+        with open(fname, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+
+    def load(self, kind, ou, id):
+        # Return record or None if there is no such record
+        fname = self.path(kind, ou, id)
+        if not os.path.isfile(fname):
+            return None
+        with open(fname, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def exists(self, kind, ou, id):
+        return os.path.isfile(self.path(kind, ou, id))
+
+    def commit(self):
+        # Files are written at once, nothing to commit
+        pass
+
+    def close(self):
+        pass
+
+
+class SnapshotStore:
+    """
+    Packed store, all snapshots in one SQLite file.
+      path--SQLite file name
+      snapshot--snapshot date records are saved to and loaded from, e.g. "2020-12-03"
+      batch--number of saves between commits, crash loses at most one batch
+    Connection is shared by all threads.
+    """
+    def __init__(self, path, snapshot, batch=500):
+        self.path = os.path.abspath(path)
+        self.snapshot = snapshot
+        self.batch = batch
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, data BLOB NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS records (snapshot TEXT NOT NULL, kind TEXT NOT NULL, "
+                        "ou TEXT NOT NULL, id TEXT NOT NULL, hash TEXT NOT NULL, "
+                        "PRIMARY KEY (snapshot, kind, ou, id)) WITHOUT ROWID")
+        self.db.execute("CREATE INDEX IF NOT EXISTS records_hash ON records (hash)")
+        self.db.commit()
+
+    def save(self, kind, ou, id, data):
+        raw = json.dumps(data, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        digest = hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            if self.db.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone() is None:
+                self.db.execute("INSERT INTO blobs VALUES (?, ?)", (digest, zlib.compress(raw, 6)))
+            self.db.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)",
+                            (self.snapshot, kind, ou, id, digest))
+            self._unsaved += 1
+            if self._unsaved >= self.batch:
+                self.db.commit()
+                self._unsaved = 0
+
+    def load(self, kind, ou, id, snapshot=None):
+        # Return record or None if there is no such record
+        snapshot = self.snapshot if snapshot is None else snapshot
+        with self._lock:
+            row = self.db.execute("SELECT b.data FROM records r JOIN blobs b ON b.hash = r.hash "
+                                  "WHERE r.snapshot = ? AND r.kind = ? AND r.ou = ? AND r.id = ?",
+                                  (snapshot, kind, ou, id)).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]).decode('utf-8'))
+
+    def exists(self, kind, ou, id):
+        with self._lock:
+            return self.db.execute("SELECT 1 FROM records WHERE snapshot = ? AND kind = ? AND ou = ? AND id = ?",
+                                   (self.snapshot, kind, ou, id)).fetchone() is not None
+
+    def keys(self, kind=None, ou=None, snapshot=None):
+        """
+        Return list of (kind, ou, id) in snapshot, optionally only of given kind and ou
+        """
+        sql = "SELECT kind, ou, id FROM records WHERE snapshot = ?"
+        args = [self.snapshot if snapshot is None else snapshot]
+        if kind is not None:
+            sql += " AND kind = ?"
+            args.append(kind)
+        if ou is not None:
+            sql += " AND ou = ?"
+            args.append(ou)
+        with self._lock:
+            return self.db.execute(sql, args).fetchall()
+
+    def snapshots(self):
+        with self._lock:
+            return [row[0] for row in self.db.execute("SELECT DISTINCT snapshot FROM records ORDER BY snapshot")]
+
+    def commit(self):
+        with self._lock:
+            self.db.commit()
+            self._unsaved = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    # Shared store, FileStore in current folder if not set
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = FileStore()
+        return _store
+
+
+def set_store(store):
+    global _store
+    with _store_lock:
+        _store = store
+    return store
@@ -0,0 +1,275 @@
+"""
+Telemetry of fetch and write stages: latency histograms per endpoint, status and retry
+counters, bytes in and out, gauges such as queue depth. HttpClient, Crawler and the
+writers report to the shared Telemetry, scripts export it as json summary and
+Prometheus text and show a live progress line with throughput and ETA.
+
+    progress = ProgressLine(len(units), "units")
+    for ou in units:
+        ...
+        progress.update()
+    progress.close()
+    get_telemetry().save("telemetry")     # telemetry.json and telemetry.prom
+"""
+import json
+import re
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Upper bounds of latency buckets, seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Path segment which is an id or code, e.g. 00057409, KAZ, SI_POV_DAY1 or KAZ;AUS, but not SDGAPI
+ID_SEGMENT = re.compile(r'^(?=[A-Z0-9_.+;:-]+$)(?:.*[0-9_;.].*|[A-Z]{2,3})$')
+
+
+def endpoint(url):
+    """
+    Endpoint of url: host and path with ids replaced by {id}, e.g.
+    api.open.undp.org/api/projects/{id}.json
+    """
+    parts = urlsplit(url)
+    segments = []
+    for seg in parts.path.split('/'):
+        stem, dot, ext = seg.partition('.') if seg.endswith('.json') else (seg, '', '')
+        segments.append(("{id}" + dot + ext) if stem and ID_SEGMENT.match(stem) else seg)
+    return parts.netloc.lower() + '/'.join(segments)
+
+
+class Histogram:
+    # Cumulative histogram of values with fixed bucket bounds, as Prometheus histogram
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Upper bound of bucket holding quantile q, inf if it is above the last bucket
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Telemetry:
+    """
+    Thread-safe counters, histograms and gauges
+      requests--{(endpoint, status): count}, status is "error" for requests without response
+      latency--{endpoint: Histogram} of seconds per attempt
+      retries--{(endpoint, reason): count}
+      bytes_in, bytes_out--{endpoint: bytes}
+      writes--{stage: [records, bytes]}, e.g. ndjson, parquet, download
+      gauges--{name: value}, e.g. crawler_pending
+    """
+    def __init__(self):
+        self.start = time.time()
+        self.requests = {}
+        self.latency = {}
+        self.retries = {}
+        self.bytes_in = {}
+        self.bytes_out = {}
+        self.writes = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def request(self, url, status, seconds, bytes_in=0, bytes_out=0):
+        # Record one attempt of request to url
+        ep = endpoint(url)
+        with self._lock:
+            key = (ep, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.setdefault(ep, Histogram()).observe(seconds)
+            self.bytes_in[ep] = self.bytes_in.get(ep, 0) + bytes_in
+            self.bytes_out[ep] = self.bytes_out.get(ep, 0) + bytes_out
+
+    def received(self, url, nbytes):
+        # Bytes of streamed body, which are read after request() is recorded
+        ep = endpoint(url)
+        with self._lock:
+            self.bytes_in[ep] = self.bytes_in.get(ep, 0) + nbytes
+
+    def retry(self, url, reason):
+        key = (endpoint(url), str(reason))
+        with self._lock:
+            self.retries[key] = self.retries.get(key, 0) + 1
+
+    def write(self, stage, records=1, nbytes=0):
+        with self._lock:
+            w = self.writes.setdefault(stage, [0, 0])
+            w[0] += records
+            w[1] += nbytes
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def totals(self):
+        # (number of requests, bytes in, number of retries)
+        with self._lock:
+            return sum(self.requests.values()), sum(self.bytes_in.values()), sum(self.retries.values())
+
+    def summary(self):
+        # Dictionary for json export
+        with self._lock:
+            elapsed = time.time() - self.start
+            endpoints = {}
+            for (ep, status), n in self.requests.items():
+                e = endpoints.setdefault(ep, {'requests': 0, 'status': {}, 'retries': {}})
+                e['requests'] += n
+                e['status'][status] = n
+            for (ep, reason), n in self.retries.items():
+                endpoints.setdefault(ep, {'requests': 0, 'status': {}, 'retries': {}})['retries'][reason] = n
+            for ep, e in endpoints.items():
+                h = self.latency.get(ep)
+                e['bytes_in'] = self.bytes_in.get(ep, 0)
+                e['bytes_out'] = self.bytes_out.get(ep, 0)
+                if h is not None and h.count:
+                    e['latency'] = {'mean': h.sum / h.count, 'p50': h.quantile(0.5), 'p95': h.quantile(0.95),
+                                    'p99': h.quantile(0.99), 'buckets': dict(zip([str(b) for b in h.buckets] + ['+Inf'],
+                                                                                 h.counts))}
+            n_req = sum(self.requests.values())
+            return {'elapsed_s': elapsed,
+                    'requests': n_req,
+                    'requests_per_s': n_req / elapsed if elapsed else 0.0,
+                    'bytes_in': sum(self.bytes_in.values()),
+                    'bytes_out': sum(self.bytes_out.values()),
+                    'retries': sum(self.retries.values()),
+                    'endpoints': endpoints,
+                    'writes': {k: {'records': v[0], 'bytes': v[1]} for k, v in self.writes.items()},
+                    'gauges': dict(self.gauges)}
+
+    def prometheus(self, prefix="devdata"):
+        # Prometheus text exposition format
+        def label(v):
+            return str(v).replace('\\', '\\\\').replace('"', '\\"')
+        lines = []
+        with self._lock:
+            lines.append(f"# TYPE {prefix}_requests_total counter")
+            for (ep, status), n in sorted(self.requests.items()):
+                lines.append(f'{prefix}_requests_total{{endpoint="{label(ep)}",status="{status}"}} {n}')
+            lines.append(f"# TYPE {prefix}_retries_total counter")
+            for (ep, reason), n in sorted(self.retries.items()):
+                lines.append(f'{prefix}_retries_total{{endpoint="{label(ep)}",reason="{reason}"}} {n}')
+            for name, counter in (("bytes_in", self.bytes_in), ("bytes_out", self.bytes_out)):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                for ep, n in sorted(counter.items()):
+                    lines.append(f'{prefix}_{name}_total{{endpoint="{label(ep)}"}} {n}')
+            lines.append(f"# TYPE {prefix}_request_seconds histogram")
+            for ep, h in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, n in zip([str(b) for b in h.buckets] + ['+Inf'], h.counts):
+                    cumulative += n
+                    lines.append(f'{prefix}_request_seconds_bucket{{endpoint="{label(ep)}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_request_seconds_sum{{endpoint="{label(ep)}"}} {h.sum}')
+                lines.append(f'{prefix}_request_seconds_count{{endpoint="{label(ep)}"}} {h.count}')
+            for name, idx in (("records", 0), ("bytes", 1)):
+                lines.append(f"# TYPE {prefix}_written_{name}_total counter")
+                for stage, w in sorted(self.writes.items()):
+                    lines.append(f'{prefix}_written_{name}_total{{stage="{label(stage)}"}} {w[idx]}')
+            lines.append(f"# TYPE {prefix}_gauge gauge")
+            for name, v in sorted(self.gauges.items()):
+                lines.append(f'{prefix}_gauge{{name="{label(name)}"}} {v}')
+        return '\n'.join(lines) + '\n'
+
+    def save(self, name):
+        # Write {name}.json and {name}.prom
+        with open(name + ".json", "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=4)
+        with open(name + ".prom", "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+
+
+class ProgressLine:
+    """
+    Live progress line: done/total, items/s, requests/s, MB in, retries, ETA from throughput.
+    Redrawn in place at most every interval seconds on stream, stderr by default
+    """
+    def __init__(self, total, label="items", interval=0.5, stream=None, telemetry=None):
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.telemetry = telemetry or get_telemetry()
+        self.done = 0
+        self.start = time.time()
+        self._req0, self._bytes0, self._retries0 = self.telemetry.totals()
+        self._shown = 0.0
+        self._drawn = -1
+        self._lock = threading.Lock()
+
+    def update(self, n=1):
+        with self._lock:
+            self.done += n
+            now = time.time()
+            if now - self._shown >= self.interval or self.done >= self.total:
+                self._shown = now
+                self._draw(now)
+
+    def line(self, now=None):
+        elapsed = max((now or time.time()) - self.start, 1e-9)
+        n_req, n_bytes, n_retries = self.telemetry.totals()
+        rate = self.done / elapsed
+        if self.done >= self.total:
+            eta = "done"
+        elif rate > 0:
+            left = (self.total - self.done) / rate
+            eta = "ETA %d:%02d:%02d" % (left // 3600, left % 3600 // 60, left % 60)
+        else:
+            eta = "ETA ?"
+        return "%d/%d %s, %.1f/s, %.1f req/s, %.1f MB, %d retries, %s" % (
+            self.done, self.total, self.label, rate, (n_req - self._req0) / elapsed,
+            (n_bytes - self._bytes0) / 2**20, n_retries - self._retries0, eta)
+
+    def iter(self, items):
+        # Yield items, counting each one as done when the next one is asked for
+        for item in items:
+            yield item
+            self.update()
+        self.close()
+
+    def _draw(self, now):
+        self._drawn = self.done
+        self.stream.write("\r" + self.line(now) + "\033[K")
+        self.stream.flush()
+
+    def close(self):
+        with self._lock:
+            if self._drawn != self.done:
+                self._draw(time.time())
+            self.stream.write("\n")
+            self.stream.flush()
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    # Shared telemetry, created on first use
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = Telemetry()
+        return _telemetry
+
+
+def set_telemetry(telemetry):
+    global _telemetry
+    with _telemetry_lock:
+        _telemetry = telemetry
+    return telemetry
@@ -0,0 +1,190 @@
+"""
+Functions shared by the open.undp.org scripts: getting operating units, projects
+and project documents into the "UNDP Projects {date}/{ou}/{project}" layout.
+Units and projects are saved to the shared store, see devdata.store, and completed
+work is recorded in the shared journal, see devdata.journal.
+"""
+import os
+import re
+
+from devdata.blobs import get_blob_store
+from devdata.client import get_client
+from devdata.crawl import TaskGroup
+from devdata.download import download_file
+from devdata.journal import get_journal
+from devdata.store import get_store
+
+API = "https://api.open.undp.org/api"
+
+
+def mkdir(dir_name, verbose = False):
+    # Safe create directory.
+    try:
+        # Create target Directory
+        os.mkdir(dir_name)
+        if verbose:
+            print("Directory " , dir_name,  " created ")
+        return 0
+    except FileExistsError:
+        if verbose:
+            print("Directory " , dir_name,  " already exists")
+        return 1
+
+
+def safe_name(s):
+    # Replace unsafe characters in file or folder name by the underscore
+    return re.sub("[\t\"\'\\*/\\\\!\\|:?<>]", "_", re.sub("(%22)", "_", s))
+
+
+def load_record(kind, ou, id, url, force_download=False):
+    """
+    Get record from store if it is there, otherwise get json from url and save it to store
+    kind, ou, id--record key, see devdata.store
+    force_download--get it from web even if it is in store
+    Return data or None if cannot get
+    """
+    store = get_store()
+    if not force_download:
+        data = store.load(kind, ou, id)
+        if data is not None:
+            return data
+    r = get_client().get(url)
+    if r.status_code != 200:
+        return None
+    data = r.json()
+    store.save(kind, ou, id, data)
+    return data
+
+
+def load_operating_units():
+    # Get index of operational units -- from store if it is there, othervise from web
+    # Operating Unit Index: https://api.open.undp.org/api/units/operating-unit-index.json
+    return load_record('index', '', 'operating-unit-index', f"{API}/units/operating-unit-index.json")
+
+
+def load_unit_projects(ou_id, force_download=False):
+    # Get operating unit data with list of its projects -- from store if it is there, othervise from web
+    # Operating Unit Data: https://api.open.undp.org/api/units/{operating - unit}.json
+    return load_record('unit', ou_id, ou_id, f"{API}/units/{ou_id}.json", force_download)
+
+
+def run_task(crawler, group, fn, *args, **kwargs):
+    # Submit task to crawler or, without crawler, run it now; count it in TaskGroup group if given
+    if crawler is not None:
+        return crawler.submit(fn, *args, group=group, **kwargs)
+    if group is not None:
+        return group.run(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+
+def get_project_document(url, title, prj_dir):
+    """
+    Get project document from url and save it to prj_dir/{safe title}/{safe file name}
+    Document is streamed to disk, interrupted download is resumed on next run.
+    Completed document is marked in journal as ('document', prj_dir, url) and skipped next time.
+    With shared BlobStore, see devdata/blobs.py, document is got through it and only linked to prj_dir
+    Return "Ok" or "Error"
+    """
+    journal = get_journal()
+    if journal.done('document', prj_dir, url):
+        return "Ok"
+    print(f"    Getting document '{title}' from {url}")
+    safe_dir = safe_name(title)
+    os.makedirs(os.path.join(prj_dir, safe_dir), exist_ok=True)
+    fname = safe_name(re.split('/', url)[-1])
+    blobs = get_blob_store()
+    if blobs is not None:
+        res = blobs.fetch(url, os.path.join(prj_dir, safe_dir, fname))
+    else:
+        res = download_file(url, os.path.join(prj_dir, safe_dir, fname))
+    if res['code'] == "Ok":
+        print(f"      Ok, saved {safe_dir}/{fname}")
+        journal.mark('document', prj_dir, url)
+    else:
+        print(f"      Unsuccesful, {res['result']}")
+    return res['code']
+
+
+def get_project_data_file(p, ou_id, crawler=None, group=None, verbose = False):
+    """
+    Get project data and associated files
+    Input:
+      p--project data structuire from operation unit json
+      ou_id--operating unit, project is saved to store as ('project', ou_id, id)
+             and documents under {ou_id}/{id}/
+      crawler--Crawler to download documents in parallel, None to download them one by one
+      group--TaskGroup to count document downloads in, None if not counted
+      verbose--True for all printouts
+    Project completed in earlier run (see journal) is loaded from store, only its
+    missing documents are downloaded
+    Return:
+      0 Ok
+      Error code if cannot get
+    """
+    journal = get_journal()
+    p_data = None
+    if journal.done('project', ou_id, p['id']):
+        p_data = get_store().load('project', ou_id, p['id'])
+    if p_data is None:
+        # Get project data and save it to store
+        # Individual Project Data: https://api.open.undp.org/api/projects/{project - id}.json
+        r = get_client().get(f"{API}/projects/{p['id']}.json")
+        if r.status_code != 200:
+            return r.status_code
+        p_data = r.json()
+        get_store().save('project', ou_id, p['id'], p_data)
+        journal.mark('project', ou_id, p['id'])
+    # Getting project documents
+    if "document_name" in p_data.keys():
+        # "document_name" is organized as three lists [0] titles, [1] urls, and [2] formats
+        # check if any documnts included, i.e. documents[0] is not empty
+        documents = p_data["document_name"]
+        if documents[0]:
+            prj_dir = os.path.join(ou_id, f"{p['id']}")
+            # Loop over titles
+            for i, title in enumerate(documents[0]):
+                # Skip  Activity Web Page
+                if title == "Activity Web Page":
+                    if verbose:
+                        print("    Skipping Activity Web Page")
+                elif not journal.done('document', prj_dir, documents[1][i]):
+                    run_task(crawler, group, get_project_document, documents[1][i], title, prj_dir)
+    return 0
+
+
+def get_unit_projects(ou, crawler=None, verbose = False, progress=None):
+    """
+    Get list of projects for an operating unit, save it to store and get all projects
+    crawler--Crawler to get projects in parallel, None to get them one by one
+    progress--ProgressLine of operating units, updated when unit is finished
+    Operating unit is marked in journal as ('ou', id) once all its projects and documents
+    are got, and skipped next time
+    Return 0 Ok, 1 if cannot get list of projects
+    """
+    journal = get_journal()
+    if journal.done('ou', ou['id']):
+        print(f"  {ou['id']} completed in earlier run, skipping")
+        if progress is not None:
+            progress.update()
+        return 0
+    ou_prj = load_unit_projects(ou['id'], force_download=True)
+    if ou_prj is None:
+        print(f"  Cannot get projects of {ou['id']}")
+        if progress is not None:
+            progress.update()
+        return 1
+
+    def unit_done(ok):
+        if ok:
+            journal.mark('ou', ou['id'])
+        if progress is not None:
+            progress.update()
+    group = TaskGroup(unit_done)
+    # Loop through projects
+    for p in ou_prj['projects']:
+        # Now handle the project
+        if verbose:
+            print(f"\n  Project {ou['id']}:{p['id']} - {p['title']}")
+        run_task(crawler, group, get_project_data_file, p, ou['id'], crawler, group, verbose = verbose)
+    group.close()
+    return 0
@@ -0,0 +1,152 @@
+"""
+Bulk ingestion of UNDP projects, instead of one /api/projects/{id}.json request per project:
+  Project Data: https://api.open.undp.org/api/project_list/?limit={1-1000}&offset={0-count/1000}
+  Comma Separated Values: https://api.open.undp.org/api/download/undp-project-data.zip
+Bulk records are flat rows, not /api/projects/{id}.json records, so they are saved to the
+shared store as ('bulk', ou, id) and never overwrite project records. Per-project requests
+are made for projects whose bulk record lacks fields we need, e.g. document_name or outputs.
+"""
+import csv
+import io
+import zipfile
+
+from devdata.client import get_client
+from devdata.download import download_file
+from devdata.store import get_store
+from devdata.undp import API, get_project_data_file, run_task
+
+PROJECT_LIST_LIMIT = 1000
+# Names of project id and operating unit fields, bulk sources don't use the same names;
+# operating unit field may hold id, ISO3 or name, see ou_resolver()
+ID_FIELDS = ('project_id', 'id', 'project')
+OU_FIELDS = ('operating_unit_id', 'operating_unit_iso3', 'iso3', 'operating_unit')
+# Member of undp-project-data.zip with one row per project, other members are per output, donor, etc.
+PROJECTS_MEMBER = "projects"
+
+
+def page_records(data):
+    """
+    Return (list of records, url of next page or None) of project_list page
+    Records come either as a list or wrapped as {'data': ...} or {'results': ...}
+    """
+    next_url = None
+    while isinstance(data, dict):
+        next_url = next_url or data.get('next')
+        if 'results' in data:
+            data = data['results']
+        elif 'data' in data:
+            data = data['data']
+        else:
+            return [], next_url
+    return (data if isinstance(data, list) else []), next_url
+
+
+def iter_project_list(limit=PROJECT_LIST_LIMIT, verbose=False, **filters):
+    """
+    Yield project records from Project Data API page by page
+    limit--records per page, at most 1000
+    filters--year, sector, operating_unit, sdg, etc., see API documentation
+    Offset is page number. Follows 'next' link if API returns it, otherwise stops at short page
+    """
+    page = 0
+    url = f"{API}/project_list/"
+    params = dict(filters, limit=limit, offset=page)
+    while url:
+        r = get_client().get(url, params=params)
+        if r.status_code != 200:
+            print(f"! Cannot get project list page {page}: status {r.status_code}")
+            return
+        records, next_url = page_records(r.json())
+        if verbose:
+            print(f"  Page {page}: {len(records)} projects")
+        yield from records
+        if next_url:
+            url, params = next_url, None
+        elif len(records) < limit:
+            url = None
+        else:
+            page += 1
+            params = dict(filters, limit=limit, offset=page)
+
+
+def get_project_zip(dest="undp-project-data.zip"):
+    """
+    Download undp-project-data.zip to dest, revalidated through HTTP cache if client has one
+    Return dest or None if cannot get
+    """
+    res = download_file(f"{API}/download/undp-project-data.zip", dest)
+    if res['code'] != "Ok":
+        print(f"! Cannot get {dest}: {res['result']}")
+        return None
+    return dest
+
+
+def iter_project_zip(path, members=None, encoding='utf-8-sig'):
+    """
+    Yield (member name, row dictionary) from CSV members of zip archive.
+    Members are read straight from the archive, nothing is extracted to disk
+    members--list of substrings of member names to read, None for all CSV members
+    """
+    with zipfile.ZipFile(path) as z:
+        for info in z.infolist():
+            name = info.filename
+            if not name.lower().endswith('.csv'):
+                continue
+            if members is not None and not any(m in name for m in members):
+                continue
+            with z.open(info) as raw:
+                for row in csv.DictReader(io.TextIOWrapper(raw, encoding=encoding, newline='')):
+                    yield name, row
+
+
+def ou_resolver(units):
+    """
+    Dictionary mapping operating unit id, ISO3 and name, in lower case, to operating unit id
+    units--operating unit index, list of {'id', 'name', ...} as load_operating_units() returns
+    """
+    resolve = {}
+    for ou in units:
+        for f in ('name', 'iso3', 'id'):
+            if ou.get(f):
+                resolve[str(ou[f]).strip().lower()] = ou['id']
+    return resolve
+
+
+def record_key(rec, resolve):
+    """
+    Return (operating unit id, project id) of bulk record, None for either if not found
+    resolve--dictionary of ou_resolver(), values of OU_FIELDS not in it are not taken
+    """
+    pid = next((str(rec[f]) for f in ID_FIELDS if rec.get(f)), None)
+    ou = next((resolve[str(rec[f]).strip().lower()] for f in OU_FIELDS
+               if rec.get(f) and str(rec[f]).strip().lower() in resolve), None)
+    return ou, pid
+
+
+def ingest_projects(records, units, detail_fields=(), crawler=None, verbose=False):
+    """
+    Save bulk project records to store as ('bulk', ou, id); project records ('project', ou, id)
+    keep the schema of /api/projects/{id}.json and are only saved by get_project_data_file()
+    units--operating unit index, to resolve operating unit ids of records
+    detail_fields--fields we need, if record lacks any of them project is got with
+                   get_project_data_file(), which also gets its documents. Bulk sources have
+                   no outputs and document_name, so with empty detail_fields none are got
+    crawler--Crawler for per-project requests, None to make them one by one
+    Return (number of projects saved from bulk records, number of per-project requests)
+    """
+    store = get_store()
+    resolve = ou_resolver(units)
+    n_bulk = 0
+    n_detail = 0
+    for rec in records:
+        ou, pid = record_key(rec, resolve)
+        if ou is None or pid is None:
+            if verbose:
+                print(f"  ! Record without project id or known operating unit: {list(rec)[:5]}")
+            continue
+        n_bulk += 1
+        store.save('bulk', ou, pid, rec)
+        if any(f not in rec for f in detail_fields):
+            n_detail += 1
+            run_task(crawler, None, get_project_data_file, {'id': pid}, ou, crawler, verbose=verbose)
+    return n_bulk, n_detail
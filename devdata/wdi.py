@@ -0,0 +1,226 @@
+"""
+Functions for World Bank Indicators API, https://datahelpdesk.worldbank.org/knowledgebase/articles/898581
+
+Several indicators of one source can be requested at once, /country/{iso3;...}/indicator/{id;...}?source=2,
+load_wdi() sends such batches concurrently and follows every page of each of them.
+Rows are written as in Get WB Data.R: {data_dir}/{series.id}.csv with columns
+series.id, country.id, country.code, year, value; rows without value are dropped.
+
+For long lists of indicators load_wdi_zip() reads the same rows from WDI bulk CSV archive,
+one sequential read of a local file instead of API requests. The archive is streamed member
+by member, nothing is extracted to disk, and only rows of listed countries and series are kept.
+"""
+import csv
+import io
+import os
+import threading
+import zipfile
+
+from devdata.client import get_client
+from devdata.crawl import Crawler
+from devdata.download import download_file
+
+WB_API = "https://api.worldbank.org/v2"
+WDI_SOURCE = 2
+PER_PAGE = 10000
+WDI_ZIP = "https://databank.worldbank.org/data/download/WDI_CSV.zip"
+COLUMNS = ("series.id", "country.id", "country.code", "year", "value")
+
+
+def read_column(path, column):
+    # Values of column in CSV file, e.g. country.code of wb-cntry.csv or series.id of wb-series.csv
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return [row[column].strip() for row in csv.DictReader(f) if row.get(column, "").strip()]
+
+
+def wdi_row(rec):
+    """
+    Convert record of API to tuple (series.id, country.id, country.code, year, value)
+    Return None if record has no value
+    """
+    if rec.get('value') is None:
+        return None
+    try:
+        year = int(rec['date'])
+    except (TypeError, ValueError):
+        year = rec['date']
+    return (rec['indicator']['id'], rec['country']['id'], rec.get('countryiso3code') or "", year, rec['value'])
+
+
+def iter_indicators(indicators, countries, date=None, per_page=PER_PAGE, source=WDI_SOURCE, verbose=False):
+    """
+    Yield records of API for list of indicators and countries, following all pages
+    date--e.g. "1998:2019", None for all years
+    Raise RuntimeError if a page cannot be got or number of records is not total reported by API,
+    so that truncated result is not taken as complete
+    """
+    url = "%s/country/%s/indicator/%s" % (WB_API, ";".join(countries), ";".join(indicators))
+    params = {'format': 'json', 'per_page': per_page}
+    if len(indicators) > 1:
+        params['source'] = source
+    if date:
+        params['date'] = date
+    page = 1
+    n = 0
+    while True:
+        r = get_client().get(url, params=dict(params, page=page))
+        if r.status_code != 200:
+            raise RuntimeError("Cannot get page %d of %s: status %d" % (page, ";".join(indicators), r.status_code))
+        data = r.json()
+        # Errors come as [{'message': [...]}], data as [meta, records]
+        if not isinstance(data, list) or len(data) < 2 or 'pages' not in data[0]:
+            raise RuntimeError("Cannot get page %d of %s: %s" % (page, ";".join(indicators), str(data)[:200]))
+        meta, records = data[0], data[1] or []
+        if verbose:
+            print("  %s: page %d of %s, %d records" % (";".join(indicators), page, meta['pages'], len(records)))
+        n += len(records)
+        yield from records
+        if page >= int(meta['pages'] or 0):
+            break
+        page += 1
+    if n != int(meta.get('total') or 0):
+        raise RuntimeError("Got %d of %s records of %s" % (n, meta.get('total'), ";".join(indicators)))
+
+
+def write_series(data_dir, series_id, rows):
+    # Write rows of series to {data_dir}/{series_id}.csv, quoted as R write.table() does
+    fname = os.path.join(data_dir, series_id + ".csv")
+    with open(fname + ".part", "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
+        w.writerow(COLUMNS)
+        w.writerows(rows)
+    os.replace(fname + ".part", fname)
+
+
+def load_wdi(indicators, countries, date=None, data_dir="Data-WB", batch=10, workers=8, log_file="WB-WDI.log",
+             per_page=PER_PAGE, verbose=False):
+    """
+    Load indicators for list of ISO3 country codes into {data_dir}/{series.id}.csv
+      batch--number of indicators per request
+      workers--number of batches requested at once
+      per_page--records per page
+    Series of a batch are written only if all its pages were got
+    Return (number of series written, number of rows)
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    lock = threading.Lock()
+    written = []
+
+    def log(line):
+        print("  " + line)
+        with lock, open(log_file, "a") as f:
+            f.write(line + "\n")
+
+    def task(ids):
+        rows = {i: [] for i in ids}
+        try:
+            for rec in iter_indicators(ids, countries, date=date, per_page=per_page, verbose=verbose):
+                row = wdi_row(rec)
+                if row is not None:
+                    rows.setdefault(row[0], []).append(row)
+        except RuntimeError as err:
+            for i in ids:
+                log("Problem with %s: %s" % (i, err))
+            return "Error"
+        for i in ids:
+            write_series(data_dir, i, rows[i])
+            with lock:
+                written.append(len(rows[i]))
+            log("Got %s, %d rows" % (i, len(rows[i])))
+        return "Ok"
+
+    crawler = Crawler(workers=workers, verbose=True)
+    for k in range(0, len(indicators), batch):
+        crawler.submit(task, indicators[k:k+batch])
+    crawler.join()
+    return len(written), sum(written)
+
+
+def get_wdi_zip(dest="WDI_CSV.zip"):
+    """
+    Download WDI bulk CSV archive to dest, revalidated through HTTP cache if client has one
+    Return dest or None if cannot get
+    """
+    res = download_file(WDI_ZIP, dest)
+    if res['code'] != "Ok":
+        print(f"! Cannot get {dest}: {res['result']}")
+        return None
+    return dest
+
+
+def iter_zip_csv(z, header_fields, encoding='utf-8-sig'):
+    """
+    Yield (header, csv reader) of CSV members of open ZipFile z whose header has all header_fields,
+    e.g. WDIData.csv (or WDICSV.csv in newer archives) has 'Country Code' and 'Indicator Code'
+    """
+    for info in z.infolist():
+        if not info.filename.lower().endswith('.csv'):
+            continue
+        with z.open(info) as raw:
+            reader = csv.reader(io.TextIOWrapper(raw, encoding=encoding, newline=''))
+            header = [h.strip() for h in next(reader, [])]
+            if all(f in header for f in header_fields):
+                yield header, reader
+
+
+def iter_wdi_zip(path, indicators, countries, date=None):
+    """
+    Yield rows (series.id, country.id, country.code, year, value) from WDI bulk CSV archive
+    for listed indicators and countries, wide year columns are turned into one row per year.
+    country.id, ISO2 code, comes from country member of archive if it has '2-alpha code'
+    date--e.g. "1998:2019", None for all years
+    """
+    indicators = set(indicators)
+    countries = set(countries)
+    first, last = (int(y) for y in date.split(':')) if date else (None, None)
+    with zipfile.ZipFile(path) as z:
+        iso2 = {}
+        for header, reader in iter_zip_csv(z, ('Country Code', '2-alpha code')):
+            i_code, i_iso2 = header.index('Country Code'), header.index('2-alpha code')
+            iso2 = {row[i_code]: row[i_iso2] for row in reader if len(row) > max(i_code, i_iso2)}
+            break
+        for header, reader in iter_zip_csv(z, ('Country Code', 'Indicator Code')):
+            i_country, i_series = header.index('Country Code'), header.index('Indicator Code')
+            years = [(k, int(h)) for k, h in enumerate(header) if h.isdigit()
+                     and (first is None or first <= int(h) <= last)]
+            for row in reader:
+                if len(row) <= i_series or row[i_series] not in indicators or row[i_country] not in countries:
+                    continue
+                for k, year in years:
+                    if k < len(row) and row[k] != '':
+                        yield (row[i_series], iso2.get(row[i_country], ""), row[i_country], year, float(row[k]))
+            break
+
+
+def load_wdi_zip(path, indicators, countries, date=None, data_dir="Data-WB"):
+    """
+    Load indicators for list of ISO3 country codes from local WDI bulk CSV archive into
+    {data_dir}/{series.id}.csv, same files as load_wdi(). Rows are written as they are read,
+    only one row is kept in memory. Series without rows in archive are reported and not written
+    Return (number of series written, number of rows)
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    files = {}
+    writers = {}
+    counts = {i: 0 for i in indicators}
+    try:
+        for i in indicators:
+            files[i] = open(os.path.join(data_dir, i + ".csv.part"), "w", encoding="utf-8", newline="")
+            writers[i] = csv.writer(files[i], quoting=csv.QUOTE_NONNUMERIC)
+            writers[i].writerow(COLUMNS)
+        for row in iter_wdi_zip(path, indicators, countries, date):
+            writers[row[0]].writerow(row)
+            counts[row[0]] += 1
+    finally:
+        for f in files.values():
+            f.close()
+    # Series without rows in archive keep their existing .csv
+    missing = [i for i in indicators if counts[i] == 0]
+    for i in indicators:
+        if counts[i]:
+            os.replace(os.path.join(data_dir, i + ".csv.part"), os.path.join(data_dir, i + ".csv"))
+        else:
+            os.remove(os.path.join(data_dir, i + ".csv.part"))
+    if missing:
+        print(f"! {len(missing)} series not found in {path}: {', '.join(missing)}")
+    return len(indicators) - len(missing), sum(counts.values())